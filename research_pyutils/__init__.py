@@ -1,16 +1,28 @@
 # expose the most frequently used functions in the top level.
-from .path_related import (mkdir_p, rm_if_exists, remove_empty_paths,
-                           copy_contents_of_folder, count_files, 
-                           copy_the_previous_if_missing, 
-                           folders_last_modification, apply_fn_all_subfolders,)
+from .path_related import (mkdir_p, mkdir_p_batch, rm_if_exists, flush_deletions,
+                           remove_empty_paths, copy_contents_of_folder,
+                           count_files, scan_counts, copy_the_previous_if_missing,
+                           folders_last_modification, apply_fn_all_subfolders,
+                           apply_fn_all_subfolders_parallel,)
+from .tree_index import index_tree
 
 try:
     from .menpo_related import (resize_all_images, from_ln_to_bb_path,
                                 process_lns_path, compute_overlap,
-                                flip_images, check_if_greyscale_values,
-                                get_segment_image, access_ln_frame,
+                                compute_overlap_matrix, non_max_suppression,
+                                match_boxes, non_max_suppression_clip,
+                                match_boxes_clip, clip_points_to_bbs,
+                                export_clip_bbs,
+                                flip_images, flip_images_batch,
+                                check_if_greyscale_values, find_greyscale_images,
+                                get_segment_image, iter_segments,
+                                get_segments_stacked, access_ln_frame,
+                                access_ln_frames,
                                 from_txt_to_numpy_points,
-                                concatenate_all_ims_from_list)
+                                from_txt_to_numpy_points_cached,
+                                build_txt_frame_index, read_txt_frames,
+                                concatenate_all_ims_from_list,
+                                montage_ims_from_list)
     from .visualizations import my_2d_rasterizer, rasterize_all_lns
 except ImportError:
     m1 = ('The menpo related utils are not imported. If '
@@ -19,7 +31,8 @@ except ImportError:
     print(m1)
 
 from .filenames_changes import (rename_files, change_suffix,
-                                strip_filenames)
+                                strip_filenames, recover_renames,
+                                change_suffix_tree, strip_filenames_tree)
 
 from .auxiliary import (execution_stats, compare_python_types,
                         whoami, populate_visual_options,
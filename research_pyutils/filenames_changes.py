@@ -1,15 +1,147 @@
 import re
-from shutil import move
+import os
+import json
+import uuid
 from glob import glob
-from os.path import sep, isdir, isfile, join
+from os.path import sep, isdir, isfile, join, exists, dirname
 from os import rename
+from concurrent.futures import ThreadPoolExecutor
 
+# # name of the journal (in the renamed folder) of an in-progress rename plan.
+_JOURNAL = '.rename_journal.json'
 
-def rename_files(file_path, ext, initial_suffix='', new_suffix='', pad_digits=6, starting_elem=0):
+
+def _write_journal(p_journal, ops, stage):
+    """ Writes (atomically) the journal of a rename plan. """
+    p_tmp = p_journal + '.tmp'
+    with open(p_tmp, 'wt') as fp:
+        json.dump({'stage': stage, 'ops': ops}, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(p_tmp, p_journal)
+
+
+def _rename_all(pairs, max_workers=None):
+    """ Renames (src, dst) pairs that do not depend on each other, in parallel. """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda p: rename(*p), pairs))
+
+
+def _run_rename_ops(ops, stage, p_journal, forward=True, max_workers=None):
+    """
+    Brings the files of a rename plan to their final (forward=True) or initial
+    positions, starting from any intermediate state of the plan.
+    Each op is a [src, tmp, dst] list; tmp is None for the renames that can be
+    performed directly (dst is not a source of another rename). The direct renames
+    and the src -> tmp renames form stage 1, the tmp -> dst renames form stage 2.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by rename_files() and recover_renames().
+    """
+    # # locate each file; a src path might be the dst of another op, hence the stage.
+    at_src, at_tmp, at_dst = [], [], []
+    for op in ops:
+        src, tmp, dst = op
+        if tmp is not None and exists(tmp):
+            at_tmp.append(op)
+        elif stage == 1 and exists(src):
+            at_src.append(op)
+        else:
+            at_dst.append(op)
+    if forward:
+        _rename_all([(src, tmp or dst) for src, tmp, dst in at_src], max_workers)
+        at_tmp += [op for op in at_src if op[1] is not None]
+        _write_journal(p_journal, ops, 2)
+        _rename_all([(tmp, dst) for src, tmp, dst in at_tmp], max_workers)
+    else:
+        _rename_all([(dst, tmp) for src, tmp, dst in at_dst if tmp is not None],
+                    max_workers)
+        _write_journal(p_journal, ops, 1)
+        _rename_all([(dst, src) for src, tmp, dst in at_dst if tmp is None], max_workers)
+        _rename_all([(tmp, src) for src, tmp, dst in at_tmp + at_dst
+                     if tmp is not None], max_workers)
+    os.remove(p_journal)
+
+
+def _apply_rename_plan(plan, folder, max_workers=None):
+    """
+    Applies a rename plan transactionally. The renames that would overwrite a
+    file that is renamed itself are performed through a temporary name, while a
+    journal allows recovering from an interruption (see recover_renames()).
+    :param plan: (list) List of (src, dst) paths. The dst paths should be unique and
+        should not exist, unless they are a src as well.
+    :param folder: (str) The folder of the journal.
+    :param max_workers: (int, optional) Number of threads for the renames.
+    :return:
+    """
+    p_journal = join(folder, _JOURNAL)
+    if isfile(p_journal):
+        m = ('An interrupted rename exists in {}, call recover_renames() '
+             'before renaming again.')
+        raise RuntimeError(m.format(folder))
+    plan = [(src, dst) for src, dst in plan if src != dst]
+    sources = {src for src, _ in plan}
+    token = uuid.uuid4().hex
+    ops = [[src, join(dirname(src), '.tmp_rename_{}_{}'.format(token, cnt))
+            if dst in sources else None, dst] for cnt, (src, dst) in enumerate(plan)]
+    if len(ops) == 0:
+        return
+    _write_journal(p_journal, ops, 1)
+    _run_rename_ops(ops, 1, p_journal, forward=True, max_workers=max_workers)
+
+
+def _split_plan(plan):
+    """
+    Splits a rename plan into the renames that can be applied and the skipped
+    ones, i.e. those whose new name exists (and is not renamed itself) or
+    coincides with the new name of a previous file. The renames to the same name
+    are dropped.
+    :param plan: (list) List of (src, dst) paths.
+    :return: (tuple) The valid plan and the skipped (src, dst) pairs.
+    """
+    valid, skipped = [(src, dst) for src, dst in plan if src != dst], []
+    while True:
+        # # skipping a file might cause new collisions (its name is not freed).
+        sources = {src for src, _ in valid}
+        seen, keep, new_skipped = set(), [], []
+        for src, dst in valid:
+            if dst in seen or (dst not in sources and exists(dst)):
+                new_skipped.append((src, dst))
+            else:
+                seen.add(dst)
+                keep.append((src, dst))
+        if len(new_skipped) == 0:
+            return keep, skipped
+        valid, skipped = keep, skipped + new_skipped
+
+
+def recover_renames(file_path, forward=True, max_workers=None):
+    """
+    Recovers an interrupted rename (e.g. of rename_files()) by using its journal.
+    :param file_path:   Path with the files of the interrupted rename.
+    :param forward:     (optional) If True, the rename is completed, otherwise the
+                        files get their original names back.
+    :param max_workers: (optional) Number of threads for the renames.
+    :return: 1 if a rename was recovered, 0 if there was nothing to recover.
+    """
+    p_journal = join(file_path, _JOURNAL)
+    if not isfile(p_journal):
+        return 0
+    with open(p_journal, 'rt') as fp:
+        journal = json.load(fp)
+    _run_rename_ops(journal['ops'], journal['stage'], p_journal, forward=forward,
+                    max_workers=max_workers)
+    return 1
+
+
+def rename_files(file_path, ext, initial_suffix='', new_suffix='', pad_digits=6, starting_elem=0,
+                 max_workers=None):
     """
     Serialises and renames files following an alphabetical ordering.
     It does this only for the files that match the pattern provided (initial_suffix + ext).
     Then renames (rewrites) those by restarting numbering from 0.
+    The whole mapping is computed first; the new names can coincide with old
+    ones (e.g. shifted numbering), while a journal allows recovering from an
+    interruption with recover_renames().
     :param file_path:       Initial path with the files to be renamed.
     :param ext:             Extension of the files that should be renamed (e.g. 'png').
     :param initial_suffix:  (optional) Initial suffix of files before extension.
@@ -17,7 +149,9 @@ def rename_files(file_path, ext, initial_suffix='', new_suffix='', pad_digits=6,
     :param pad_digits:      (optional) Number of digits for padding the new filenames.
     :param starting_elem:    (optional) First element name, by default zero_based.
     Should be int, smaller than 10.
-    :return:
+    :param max_workers:     (optional) Number of threads for the renames.
+    :return: 1 on success, -1 if the path does not exist or if a new name
+    coincides with a file that is not renamed.
     """
     if not isdir(file_path):
         return -1
@@ -28,16 +162,60 @@ def rename_files(file_path, ext, initial_suffix='', new_suffix='', pad_digits=6,
     ext = '.' + ext if ext[0] != '.' else ext
     padding = '%.' + str(int(pad_digits)) + 'd'
     list2rename = sorted(glob(file_path + '*' + initial_suffix + ext))
-    for cnt, elem_p in enumerate(list2rename):
-        rename(elem_p, file_path + padding % (cnt + starting_elem) + new_suffix + ext)
+    plan = [(elem_p, file_path + padding % (cnt + starting_elem) + new_suffix + ext)
+            for cnt, elem_p in enumerate(list2rename)]
+    plan, skipped = _split_plan(plan)
+    if len(skipped) > 0:
+        m = 'The file {} already exists, not overwritting it (nothing renamed).'
+        print(m.format(skipped[0][1]))
+        return -1
+    _apply_rename_plan(plan, file_path, max_workers=max_workers)
     return 1
 
 
-def change_suffix(file_path, ext, initial_suffix='', new_suffix=''):
+def _list_matching(folder, ending='', files_only=False):
+    """
+    Sorted paths of the (non-hidden, similar to glob) entries of the folder
+    whose name ends with ending.
+    """
+    with os.scandir(folder) as it:
+        return sorted(entry.path for entry in it if not entry.name.startswith('.')
+                      and entry.name.endswith(ending)
+                      and not (files_only and entry.is_dir()))
+
+
+def _change_suffix_plan(file_path, ext, initial_suffix='', new_suffix='', files_only=False):
+    """ Returns the rename plan of change_suffix() for a single folder. """
+    end1 = initial_suffix + ext
+    end_p = len(end1)
+    plan = []
+    for elem_p in _list_matching(file_path, end1, files_only=files_only):
+        elem_n = elem_p[elem_p.rfind(sep) + 1:]
+        till_pos = -end_p if elem_n.rfind('_') < 0 else elem_n.rfind('_')
+        plan.append((elem_p, file_path + elem_n[:till_pos] + new_suffix + ext))
+    return plan
+
+
+def _strip_filenames_plan(path, ext='', pattern=None, files_only=False):
+    """ Returns the rename plan of strip_filenames() for a single folder. """
+    plan = []
+    for cl in _list_matching(path, ext, files_only=files_only):
+        # get only the filename
+        cl1 = cl[cl.rfind(sep) + 1:]
+        # strip all white spaces, quatation points, etc.
+        name = pattern.sub('', cl1)
+        if len(name) > 0:
+            plan.append((cl, path + name))
+    return plan
+
+
+def change_suffix(file_path, ext, initial_suffix='', new_suffix='', max_workers=None):
     """
     Change the suffix in the files in file_path.
     If initial_suffix is provided, only the files that have it will be considered,
     otherwise all files in the path with the specified extension.
+    The files whose new name already exists (or coincides with the new name of
+    another file) are skipped.
 
     ASSUMPTION : If the symbol '_' exists in a file, then only the last occurrence
     will be considered as part of the filename and will be removed.
@@ -45,46 +223,102 @@ def change_suffix(file_path, ext, initial_suffix='', new_suffix=''):
     :param ext:             Extension of the files that should be renamed (e.g. 'png').
     :param initial_suffix:  (optional) Initial suffix of files before extension.
     :param new_suffix:      (optional) New suffix (if '', no suffix will be provided).
+    :param max_workers:     (optional) Number of threads for the renames.
     :return:
     """
     if not isdir(file_path):
         return -1
-    # #  TODO: modify in case we want to include all the (diverse) files in a
-    # single folder.
     file_path = join(file_path, '')  # add a separator if non exists.
     ext = '.' + ext if ext[0] != '.' else ext
-    end1 = initial_suffix + ext
-    end_p = len(end1)
-    list2rename = sorted(glob(file_path + '*' + end1))
-    for cnt, elem_p in enumerate(list2rename):
-        elem_n = elem_p[elem_p.rfind(sep) + 1:]
-        till_pos = -end_p if elem_n.rfind('_') < 0 else elem_n.rfind('_')
-        new_name = file_path + elem_n[:till_pos] + new_suffix + ext
-        if isfile(new_name):
-            # TODO: think about this case, e.g. if 01.txt and 01_1.txt both exist.
-            m = 'The file already exists, not overwritting it.'
-            print(m.format(new_name))
-            continue
-        rename(elem_p, new_name)
+    plan, skipped = _split_plan(_change_suffix_plan(file_path, ext, initial_suffix,
+                                                    new_suffix))
+    for _, new_name in skipped:
+        # TODO: think about this case, e.g. if 01.txt and 01_1.txt both exist.
+        m = 'The file {} already exists, not overwritting it.'
+        print(m.format(new_name))
+    _apply_rename_plan(plan, file_path, max_workers=max_workers)
     return 1
 
 
-def strip_filenames(path, ext='', allowed_chars=None):
+def strip_filenames(path, ext='', allowed_chars=None, max_workers=None):
     """
     Strips the filenames from whitespaces and other 'problematic' chars.
     In other words converts the filenames to alpharethmetic chars.
+    The files whose stripped name already exists (or coincides with the stripped
+    name of another file) are not renamed.
     :param path:    (String) Base path for the filenames.
     :param ext:     (String, optional) If provided, the glob will rename only these files.
     :param allowed_chars:  (String, optional) If provided, it includes the
             chars to be allowed in the re function compile().
+    :param max_workers: (int, optional) Number of threads for the renames.
     :return:
     """
     if allowed_chars is None:
         allowed_chars = '[^a-zA-Z0-9.]+'
     pattern = re.compile(allowed_chars)
-    for cl in sorted(glob(path + '*' + ext)):
-        # get only the filename
-        cl1 = cl[cl.rfind(sep) :]
-        # strip all white spaces, quatation points, etc.
-        name = pattern.sub('', cl1)
-        move(path + cl1, path + name)
+    path = join(path, '')
+    plan, skipped = _split_plan(_strip_filenames_plan(path, ext, pattern))
+    for cl, name in skipped:
+        print('The file {} already exists, not renaming {}.'.format(name, cl))
+    _apply_rename_plan(plan, path, max_workers=max_workers)
+
+
+def _rename_tree(root, plan_fn, max_workers=None):
+    """
+    Applies the rename plans (plan_fn(folder) per folder) to all the folders
+    of the tree. The plans (and the collisions) of all the folders are computed
+    before any file is renamed; the folders are processed in parallel threads.
+    The links to folders are not followed, i.e. only files inside root are renamed.
+    :return: (dict) The number of 'renamed' files and the 'skipped' (src, dst) pairs.
+    """
+    from .path_related import _list_subfolders
+    folders = _list_subfolders(join(root, ''), follow_symlinks=False)
+    # # check for interrupted renames before renaming any folder.
+    interrupted = [folder for folder in folders if isfile(join(folder, _JOURNAL))]
+    if len(interrupted) > 0:
+        m = ('An interrupted rename exists in {}, call recover_renames() '
+             'before renaming again.')
+        raise RuntimeError(m.format(', '.join(interrupted)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        plans = list(executor.map(lambda folder: _split_plan(plan_fn(folder)), folders))
+        list(executor.map(lambda args: _apply_rename_plan(args[1][0], args[0]),
+                          zip(folders, plans)))
+    return {'renamed': sum(len(plan) for plan, _ in plans),
+            'skipped': [pair for _, skipped in plans for pair in skipped]}
+
+
+def change_suffix_tree(root, ext, initial_suffix='', new_suffix='', max_workers=None):
+    """
+    Recursive version of change_suffix(), i.e. changes the suffix of the files
+    in root and all its sub-folders.
+    :param root:            Root path of the tree with the files to be renamed.
+    :param ext:             Extension of the files that should be renamed (e.g. 'png').
+    :param initial_suffix:  (optional) Initial suffix of files before extension.
+    :param new_suffix:      (optional) New suffix (if '', no suffix will be provided).
+    :param max_workers:     (optional) Number of threads (folders processed concurrently).
+    :return: (dict) The number of 'renamed' files and the 'skipped' (src, dst) pairs.
+    """
+    assert isdir(root), 'The path {} does not exist.'.format(root)
+    ext = '.' + ext if ext[0] != '.' else ext
+    plan_fn = lambda folder: _change_suffix_plan(folder, ext, initial_suffix, new_suffix,
+                                                 files_only=True)
+    return _rename_tree(root, plan_fn, max_workers=max_workers)
+
+
+def strip_filenames_tree(root, ext='', allowed_chars=None, max_workers=None):
+    """
+    Recursive version of strip_filenames(), i.e. strips the filenames in root
+    and all its sub-folders (the folder names are not modified).
+    :param root:    (String) Root path of the tree with the files to be renamed.
+    :param ext:     (String, optional) If provided, only these files are renamed.
+    :param allowed_chars:  (String, optional) If provided, it includes the
+            chars to be allowed in the re function compile().
+    :param max_workers: (int, optional) Number of threads (folders processed concurrently).
+    :return: (dict) The number of 'renamed' files and the 'skipped' (src, dst) pairs.
+    """
+    assert isdir(root), 'The path {} does not exist.'.format(root)
+    if allowed_chars is None:
+        allowed_chars = '[^a-zA-Z0-9.]+'
+    pattern = re.compile(allowed_chars)
+    plan_fn = lambda folder: _strip_filenames_plan(folder, ext, pattern, files_only=True)
+    return _rename_tree(root, plan_fn, max_workers=max_workers)
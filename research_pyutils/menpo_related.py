@@ -1,3 +1,5 @@
+import io
+import os
 from os.path import join, isdir, isfile
 from functools import partial
 import numpy as np
@@ -6,7 +8,68 @@ from menpo.image import Image
 from menpo.shape import PointCloud
 
 
-def process_lns_path(process, shapes=None, p_in=None, p_out=None, overwrite=None):
+def _process_ln_file(p_ln, process, p_out=None, overwrite=None):
+    """
+    Imports a landmark file, processes it and (optionally) exports the result;
+    it runs in a worker process of process_lns_path().
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by process_lns_path().
+    :return: The processed landmarks, or None if they are exported.
+    """
+    ln_out = process(mio.import_landmark_file(p_ln))
+    if p_out is None:
+        return ln_out
+    mio.export_landmark_file(ln_out, join(p_out, os.path.basename(p_ln)),
+                             overwrite=overwrite)
+
+
+def _process_ln_chunk(paths, process, p_out=None, overwrite=None):
+    """
+    Applies _process_ln_file() to a chunk of files; it runs in a worker process.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by process_lns_path().
+    """
+    return [_process_ln_file(p_ln, process, p_out=p_out, overwrite=overwrite)
+            for p_ln in paths]
+
+
+def _stream_lns_path(process, p_in, p_out=None, overwrite=None, ext='pts',
+                     max_workers=None, chunksize=64):
+    """
+    Generator that processes the landmark files of p_in one by one (serially or
+    in chunks in a process pool). Only the filenames are listed up front; the
+    number of chunks submitted (and not yet consumed) is bounded, hence the
+    processed landmarks are not all kept in memory.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by process_lns_path().
+    """
+    from collections import deque
+    suffix = '.' + ext
+    with os.scandir(p_in) as it:
+        paths = sorted(e.path for e in it if e.name.endswith(suffix) and e.is_file())
+    if max_workers is None:
+        for p_ln in paths:
+            yield _process_ln_file(p_ln, process, p_out=p_out, overwrite=overwrite)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    max_pending = 2 * max_workers
+    chunks = (paths[i:i + chunksize] for i in range(0, len(paths), chunksize))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_process_ln_chunk, chunk, process,
+                                           p_out=p_out, overwrite=overwrite))
+            if len(pending) >= max_pending:
+                # # wait for the oldest chunk (keeps the order of the files).
+                for res in pending.popleft().result():
+                    yield res
+        while pending:
+            for res in pending.popleft().result():
+                yield res
+
+
+def process_lns_path(process, shapes=None, p_in=None, p_out=None, overwrite=None,
+                     lazy=False, max_workers=None, chunksize=64, ext='pts'):
     """
     Processes a list of landmark files. The processing is performed per shape (file)
     and depends on the process function defined.
@@ -20,11 +83,29 @@ def process_lns_path(process, shapes=None, p_in=None, p_out=None, overwrite=None
     :param p_in:    (string, optional) Input path for shapes if shapes is not provided.
     :param p_out:   (string, optional) Output path for the processed landmarks.
     :param overwrite: (bool, optional) Whether to overwrite existing files in p_out.
-    :return:
+    :param lazy:    (bool, optional) If True (or max_workers is provided), the files
+                    of p_in are streamed: each one is imported, processed and exported
+                    independently (no dummy image). The process function should be
+                    picklable (module-level) when max_workers is provided.
+    :param max_workers: (int, optional) Number of processes for the streamed mode. If
+                    None, the files are processed serially.
+    :param chunksize: (int, optional) Number of files per task sent to the processes.
+    :param ext:     (string, optional) Extension of the landmark files in the streamed mode.
+    :return: In the streamed mode, a generator with the processed landmarks or, if
+             p_out is provided, the number of files exported. Otherwise the list
+             of processed landmarks.
     """
     if p_out is not None:
         assert(isdir(p_out))
 
+    if shapes is None and (lazy or max_workers is not None):
+        assert(isdir(p_in))
+        results = _stream_lns_path(process, p_in, p_out=p_out, overwrite=overwrite,
+                                   ext=ext, max_workers=max_workers, chunksize=chunksize)
+        if p_out is None:
+            return results
+        return sum(1 for _ in results)
+
     if shapes is None:
         # import the shapes from p_in.
         assert(isdir(p_in))
@@ -47,7 +128,26 @@ def process_lns_path(process, shapes=None, p_in=None, p_out=None, overwrite=None
     return ln_out
 
 
-def from_ln_to_bb_path(shapes=None, p_in=None, p_out=None, overwrite=None):
+def _ln_pointcloud(ln):
+    """
+    Returns the points of an imported landmark file; depending on the menpo
+    version, it is a landmark group (with .lms) or a dict of groups (the first
+    group is returned).
+    """
+    if hasattr(ln, 'lms'):
+        return ln.lms
+    if isinstance(ln, dict):
+        return next(iter(ln.values()))
+    return ln
+
+
+def _ln_to_bb(ln):
+    """ Tightest bounding box of a landmark group; module-level to be picklable. """
+    return _ln_pointcloud(ln).bounding_box()
+
+
+def from_ln_to_bb_path(shapes=None, p_in=None, p_out=None, overwrite=None,
+                       lazy=False, max_workers=None, chunksize=64):
     """
     Wrapper around process_lns_path() for converting the landmarks to the
     respective tightest bounding boxes.
@@ -56,41 +156,142 @@ def from_ln_to_bb_path(shapes=None, p_in=None, p_out=None, overwrite=None):
     :param p_in:    (string, optional) Input path for shapes if shapes is not provided.
     :param p_out:   (string, optional) Output path for the processed landmarks.
     :param overwrite: (bool, optional) Whether to overwrite existing files in p_out.
+    :param lazy:    (bool, optional) Stream the files of p_in (see process_lns_path()).
+    :param max_workers: (int, optional) Number of processes for the streamed mode.
+    :param chunksize: (int, optional) Number of files per task sent to the processes.
     :return:
     """
-    f = lambda ln: ln.lms.bounding_box()
-    return process_lns_path(f, shapes, p_in, p_out, overwrite)
+    return process_lns_path(_ln_to_bb, shapes, p_in, p_out, overwrite, lazy=lazy,
+                            max_workers=max_workers, chunksize=chunksize)
 
 
-def resize_all_images(images, f=None):
+def _probe_image_size(p_im):
+    """
+    Reads only the header of a png/jpeg image to find its size.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by resize_all_images().
+    :return: (tuple) (height, width, n_channels), or None if the header is not
+        recognised (e.g. other formats), in which case the image should be decoded.
+    """
+    import struct
+    with open(p_im, 'rb') as f:
+        head = f.read(26)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            w, h = struct.unpack('>II', head[16:24])
+            # # channels per colour type (the palette is converted to rgb).
+            n_ch = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(head[25], 3)
+            return h, w, n_ch
+        if head[:2] != b'\xff\xd8':
+            return None
+        # # jpeg: walk over the segments until the start of frame (SOFn).
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xff:
+                return None
+            if marker[1] in (0xd8, 0x01) or 0xd0 <= marker[1] <= 0xd7:
+                continue
+            seg_len = struct.unpack('>H', f.read(2))[0]
+            if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+                _, h, w, n_ch = struct.unpack('>BHHB', f.read(6))
+                return h, w, n_ch
+            f.seek(seg_len - 2, 1)
+
+
+def _import_resized(p_im, final_size, n_channels):
+    """
+    Imports and resizes an image; it runs in a worker process of resize_all_images().
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by resize_all_images().
+    :return: (numpy matrix) The (n_channels, height, width) pixels.
+    """
+    pixels = mio.import_image(p_im).resize(final_size).pixels
+    if pixels.shape[0] < n_channels:
+        # # greyscale image in a colour batch.
+        pixels = np.repeat(pixels[:1], n_channels, axis=0)
+    return pixels[:n_channels]
+
+
+def resize_all_images(images, f=None, out=None, max_workers=None, chunksize=16,
+                      dtype=np.float32):
     """
     Resizes all images to a new size, defined by the function f.
-    :param images: (list) Menpo images.
+    If paths are provided instead of images, the sizes are read from the
+    png/jpeg headers (without decoding the images) and then the images are
+    imported and resized in a process pool and written in a preallocated
+    (N, C, H, W) matrix (in memory or a memmap).
+    :param images: (list) Menpo images or paths of images.
     :param f: (function, optional) If not provided, np.min is considered as the
         default function. If provided, it should accept a 2d array with all the
         shapes and return the final shape (2-element numpy vector).
-    :return: (list) Resized menpo images.
+    :param out: (numpy matrix or str, optional) Only for paths. The matrix to write
+        the pixels in or the path of a .npy file to create as a memmap.
+    :param max_workers: (int, optional) Only for paths. Number of processes.
+    :param chunksize: (int, optional) Only for paths. Images per task sent to the processes.
+    :param dtype: (numpy dtype, optional) Only for paths. Dtype of the new matrix.
+    :return: (list) Resized menpo images or, for paths, the (N, C, H, W) matrix.
     """
     if f is None:
         f = lambda sizes: np.min(sizes, axis=0)
-    sizes = np.array([im.shape for im in images])
-    # define the new size based on f
-    final_size = f(sizes)
-    # resize the images to the final size
-    images_resized = [im.resize(final_size) for im in images]
-    return images_resized
+    if len(images) == 0 or not isinstance(images[0], (str, os.PathLike)):
+        sizes = np.array([im.shape for im in images])
+        # define the new size based on f
+        final_size = f(sizes)
+        # resize the images to the final size
+        images_resized = [im.resize(final_size) for im in images]
+        return images_resized
+
+    from concurrent.futures import ProcessPoolExecutor
+    probed = []
+    for p_im in images:
+        sz = _probe_image_size(p_im)
+        if sz is None:
+            # # unknown header, decode the image for its size.
+            im = mio.import_image(p_im)
+            sz = im.shape + (im.n_channels,)
+        probed.append(sz)
+    probed = np.array(probed)
+    final_size = np.array(f(probed[:, :2])).astype(np.int64)
+    # # the alpha channel is not imported, i.e. 2 -> 1, 4 -> 3 channels.
+    n_channels = int(np.max(probed[:, 2] - (probed[:, 2] % 2 == 0)))
+    shape = (len(images), n_channels) + tuple(int(sz) for sz in final_size)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+    assert out.shape == shape, 'The output should be of shape {}.'.format(shape)
+    func = partial(_import_resized, final_size=final_size, n_channels=n_channels)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for i, pixels in enumerate(executor.map(func, images, chunksize=chunksize)):
+            out[i] = pixels
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+# # permutation of the ibug68 points after a horizontal flip, i.e. the same
+# # mapping as the menpo face_ibug_68_mirrored_to_face_ibug_68() (computed once).
+_r = np.arange
+_IBUG68_MIRROR = np.hstack([_r(0, 17)[::-1], _r(22, 27)[::-1], _r(17, 22)[::-1],
+                            _r(27, 31), _r(31, 36)[::-1], np.roll(_r(42, 48)[::-1], 4),
+                            np.roll(_r(36, 42)[::-1], 4), np.roll(_r(48, 60)[::-1], 7),
+                            np.roll(_r(60, 68)[::-1], 5)])
+del _r
 
 
 def flip_images(ims, rotate=False):
     """
     Horizontally flips the image(s). For the landmarks with 68 markup it applies
     the menpo convenience function for semantically correcting the flipped ones.
+    For a stack of pixels (numpy array), it calls the batch version flip_images_batch().
     :param ims: (image or list of images) Menpo images to flip.
     :param rotate: (bool, optional) Add an optional rotation to the image(s).
     :return: The flipped images. If the images contain landmarks of ibug68 format,
         those will also be flipped appropriately (semantically).
     """
     from menpo.landmark import face_ibug_68_mirrored_to_face_ibug_68 as mirr68
+    if isinstance(ims, np.ndarray):
+        return flip_images_batch(ims, rotate=rotate)[0]
     if not isinstance(ims, list):
         # this is the case of a single image.
         ims = [ims]
@@ -103,7 +304,7 @@ def flip_images(ims, rotate=False):
             else:
                 m1 = ('The landmark group {} not recognised, '
                       'please correct manually.')
-                print(m1.format(gr1))
+                print(m1.format(gr))
         if rotate:
             rr = np.random.randint(-20, 20)
             im2 = im1.rotate_ccw_about_centre(rr)
@@ -113,6 +314,73 @@ def flip_images(ims, rotate=False):
     return ims_flipped
 
 
+def _rotate_batch(pixels, points, angles):
+    """
+    Rotates (counter-clockwise about the centre, as the menpo
+    rotate_ccw_about_centre() with retain_shape) a stack of images and their
+    landmarks with a single batched affine warp (bilinear interpolation).
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by flip_images_batch().
+    """
+    n, _, h, w = pixels.shape
+    theta = np.deg2rad(angles)[:, None, None]
+    cos, sin = np.cos(theta), np.sin(theta)
+    cy, cx = h / 2., w / 2.
+    dy, dx = np.mgrid[:h, :w].astype(np.float64)
+    dy, dx = dy - cy, dx - cx
+    # # source coordinates of every output pixel (inverse rotation).
+    sy = cos * dy + sin * dx + cy
+    sx = -sin * dy + cos * dx + cx
+    valid = (sy >= 0) & (sy <= h - 1) & (sx >= 0) & (sx <= w - 1)
+    y0 = np.clip(np.floor(sy).astype(np.int64), 0, h - 1)
+    x0 = np.clip(np.floor(sx).astype(np.int64), 0, w - 1)
+    y1, x1 = np.minimum(y0 + 1, h - 1), np.minimum(x0 + 1, w - 1)
+    wy, wx = (sy - y0)[..., None], (sx - x0)[..., None]
+    ni = np.arange(n)[:, None, None]
+    # # each gather is (n, h, w, n_channels).
+    out = ((pixels[ni, :, y0, x0] * (1 - wx) + pixels[ni, :, y0, x1] * wx) * (1 - wy) +
+           (pixels[ni, :, y1, x0] * (1 - wx) + pixels[ni, :, y1, x1] * wx) * wy)
+    out *= valid[..., None]
+    out = np.moveaxis(out, -1, 1).astype(pixels.dtype)
+    if points is not None:
+        theta = theta[:, :, 0]
+        py, px = points[..., 0] - cy, points[..., 1] - cx
+        points = np.stack((np.cos(theta) * py - np.sin(theta) * px + cy,
+                           np.sin(theta) * py + np.cos(theta) * px + cx), axis=-1)
+    return out, points
+
+
+def flip_images_batch(pixels, points=None, rotate=False, angles=None):
+    """
+    Batch version of flip_images() for a stack of images (pixels) and their
+    landmarks. All the images are flipped with a single slice and the ibug68
+    landmarks are corrected semantically with a precomputed permutation.
+    :param pixels: (numpy matrix) The (N, C, H, W) pixels.
+    :param points: (numpy matrix, optional) The (N, n_landm, 2) landmarks (menpo
+        format, i.e. (y, x)). Only the 68 markup is corrected semantically.
+    :param rotate: (bool, optional) Add a random rotation ([-20, 20) degrees) per image.
+    :param angles: (array, optional) The rotation angles (degrees) per image; if
+        provided, they are used instead of the random ones.
+    :return: i) the flipped pixels (a view if there is no rotation), ii) the
+        flipped landmarks (or None).
+    """
+    pixels = pixels[..., ::-1]
+    if points is not None:
+        points = np.array(points, dtype=np.float64)
+        points[..., 1] = pixels.shape[-1] - 1 - points[..., 1]
+        if points.shape[1] == 68:
+            points = points[:, _IBUG68_MIRROR]
+        else:
+            m1 = ('The landmarks with {} points not recognised, '
+                  'please correct manually.')
+            print(m1.format(points.shape[1]))
+    if rotate or angles is not None:
+        if angles is None:
+            angles = np.random.randint(-20, 20, size=len(pixels))
+        pixels, points = _rotate_batch(pixels, points, np.asarray(angles, dtype=np.float64))
+    return pixels, points
+
+
 # aux function to transform the bb in a [y_min, x_min, y_max, x_max format].
 # pts can be of a bounding box/landmark points format.
 bb_format_minmax = lambda pts: [np.min(pts[:, 0]), np.min(pts[:, 1]),
@@ -147,33 +415,247 @@ def compute_overlap(pt0, pt1):
     return overlap
 
 
-def check_if_greyscale_values(im, n_sample_points=30, thresh=0.001):
+def _to_minmax_boxes(boxes):
+    """
+    Converts a stack of bounding boxes/landmark points to the [y_min, x_min,
+    y_max, x_max] format of bb_format_minmax().
+    :param boxes: Either a (N, 4) array already in the minmax format, or a
+        (N, n_points, 2) array, or a list of (n_points, 2) arrays.
+    :return: (N, 4) array.
+    """
+    if len(boxes) == 0:
+        return np.zeros((0, 4))
+    if isinstance(boxes, (list, tuple)):
+        return np.array([bb_format_minmax(np.asarray(pts)) for pts in boxes])
+    boxes = np.asarray(boxes)
+    if boxes.ndim == 2 and boxes.shape[1] == 4:
+        return boxes
+    return np.concatenate((boxes.min(axis=1), boxes.max(axis=1)), axis=1)
+
+
+def compute_overlap_matrix(pts0, pts1):
+    """
+    Computes the overlap (area of intersection / area of union) between all
+    the pairs of two stacks of bounding boxes, i.e. the vectorized version of
+    compute_overlap(), with the same (+1 pixel) convention and results.
+    :param pts0: (N, 4) minmax boxes (see bb_format_minmax), (N, n_points, 2) array
+        of bounding boxes/landmark points or list of (n_points, 2) arrays.
+    :param pts1: Same as pts0, with M boxes.
+    :return: (N, M) array with the overlaps.
+    """
+    b0 = _to_minmax_boxes(pts0)[:, None, :]
+    b1 = _to_minmax_boxes(pts1)[None, :, :]
+    # # bounding boxes of intersection (broadcasted to N x M).
+    bb_i = [np.maximum(b0[..., 0], b1[..., 0]), np.maximum(b0[..., 1], b1[..., 1]),
+            np.minimum(b0[..., 2], b1[..., 2]), np.minimum(b0[..., 3], b1[..., 3])]
+    inter_area = bb_area(bb_i)
+    valid = (bb_i[3] - bb_i[1] + 1 > 0) & (inter_area > 0)
+    union_area = bb_area(np.moveaxis(b0, -1, 0)) + bb_area(np.moveaxis(b1, -1, 0)) - inter_area
+    overlap = np.zeros(inter_area.shape)
+    overlap[valid] = inter_area[valid] / union_area[valid]
+    return overlap
+
+
+def non_max_suppression(boxes, scores, thresh=0.5, max_out=None):
+    """
+    Greedy non-maximum suppression. The boxes are visited in descending score
+    and each one suppresses the (not yet suppressed) boxes that overlap with it
+    more than thresh. The overlaps are computed once with compute_overlap_matrix().
+    :param boxes: (N, 4) minmax boxes, (N, n_points, 2) array or list of arrays.
+    :param scores: (N,) array with the score of each box.
+    :param thresh: (float, optional) Overlap threshold for the suppression.
+    :param max_out: (int, optional) Maximum number of boxes to keep.
+    :return: (array) The indices of the kept boxes, in descending score.
+    """
+    scores = np.asarray(scores)
+    if len(scores) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    overlap = compute_overlap_matrix(boxes, boxes)
+    order = np.argsort(-scores, kind='stable')
+    suppressed = np.zeros(len(scores), dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if max_out is not None and len(keep) >= max_out:
+            break
+        suppressed |= overlap[i] > thresh
+    return np.array(keep, dtype=np.int64)
+
+
+def match_boxes(det, gt, thresh=0.5, scores=None, method='greedy'):
+    """
+    Matches detections to ground truth boxes (one-to-one) based on their overlap.
+    :param det: (N, 4) minmax boxes, (N, n_points, 2) array or list of arrays.
+    :param gt: Same as det, with the M ground truth boxes.
+    :param thresh: (float, optional) Minimum overlap of a match.
+    :param scores: (array, optional) Scores of the detections. If provided (greedy),
+        the detections are matched in descending score to their best available gt,
+        otherwise the pairs are matched in descending overlap.
+    :param method: (str, optional) 'greedy' or 'hungarian' (optimal assignment
+        maximizing the total overlap, requires scipy).
+    :return: (tuple) The indices of the matched detections and of the respective gt.
+    """
+    overlap = compute_overlap_matrix(det, gt)
+    empty = np.zeros((0,), dtype=np.int64)
+    if overlap.size == 0:
+        return empty, empty
+    if method == 'hungarian':
+        from scipy.optimize import linear_sum_assignment
+        det_idx, gt_idx = linear_sum_assignment(-overlap)
+        sel = overlap[det_idx, gt_idx] >= thresh
+        return det_idx[sel].astype(np.int64), gt_idx[sel].astype(np.int64)
+    assert method == 'greedy', 'Unknown method {}.'.format(method)
+    ov = np.where(overlap >= thresh, overlap, -1.)
+    det_idx, gt_idx = [], []
+    if scores is not None:
+        for i in np.argsort(-np.asarray(scores), kind='stable'):
+            j = np.argmax(ov[i])
+            if ov[i, j] >= 0:
+                det_idx.append(i)
+                gt_idx.append(j)
+                ov[:, j] = -1.
+    else:
+        # # visit the pairs in descending overlap, skip the used rows/columns.
+        used_det, used_gt = np.zeros(ov.shape[0], bool), np.zeros(ov.shape[1], bool)
+        for flat in np.argsort(-ov, axis=None, kind='stable'):
+            i, j = np.unravel_index(flat, ov.shape)
+            if ov[i, j] < 0:
+                break
+            if not (used_det[i] or used_gt[j]):
+                used_det[i], used_gt[j] = True, True
+                det_idx.append(i)
+                gt_idx.append(j)
+    return np.array(det_idx, dtype=np.int64), np.array(gt_idx, dtype=np.int64)
+
+
+def non_max_suppression_clip(boxes, scores, thresh=0.5, max_out=None):
+    """
+    Applies non_max_suppression() to every frame of a clip.
+    :param boxes: (list) The boxes of each frame (see non_max_suppression()).
+    :param scores: (list) The scores of each frame.
+    :return: (list) The indices of the kept boxes per frame.
+    """
+    return [non_max_suppression(bb, sc, thresh=thresh, max_out=max_out)
+            for bb, sc in zip(boxes, scores)]
+
+
+def match_boxes_clip(det, gt, thresh=0.5, scores=None, method='greedy'):
+    """
+    Applies match_boxes() to every frame of a clip.
+    :param det: (list) The detections of each frame (see match_boxes()).
+    :param gt: (list) The ground truth boxes of each frame.
+    :param scores: (list, optional) The scores of the detections of each frame.
+    :return: (list) The (detection indices, gt indices) tuple per frame.
+    """
+    if scores is None:
+        scores = [None] * len(det)
+    return [match_boxes(d, g, thresh=thresh, scores=sc, method=method)
+            for d, g, sc in zip(det, gt, scores)]
+
+
+def _is_greyscale_pixels(pixels, thresh=0.001, chunk_rows=256):
+    """
+    Checks whether all the (C, H, W) pixels have the same values over the
+    channels; the rows are processed in chunks with an early exit on the first
+    chunk with a colour pixel.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by check_if_greyscale_values().
+    """
+    for r in range(0, pixels.shape[1], chunk_rows):
+        chunk = pixels[:, r:r + chunk_rows]
+        if np.any(np.abs(chunk[1:] - chunk[:1]) >= thresh):
+            return False
+    return True
+
+
+def check_if_greyscale_values(im, n_sample_points=30, thresh=0.001, stride=None,
+                              full=False, chunk_rows=256):
     """
     Check whether a 3-channel image is indeed grayscale.
-    Iterates over uniformely sampled points and checks whether the
-    values over the channels are the same. The more points are checked the
+    Checks (vectorized) whether the values over the channels are the same on
+    uniformely sampled points. The more points are checked the
     better the probability that it is not 'just' a proportion of the image
-    black/white.
+    black/white; for a certain answer check the full image.
     :param im:      (menpo image) Image to check.
     :param n_sample_points:  (int) Number of points to check in the image.
     :param thresh:  (float) The threshold for similarity.
+    :param stride:  (int, optional) If provided, the points of a subgrid (every
+                    stride rows/columns) are checked instead of random ones.
+    :param full:    (bool, optional) If True, all the pixels are checked (in chunks
+                    of chunk_rows rows, with early exit).
+    :param chunk_rows: (int, optional) The rows per chunk for the full check.
     :return: True, if it is indeed greyscale, False otherwise.
     """
-    cond = True
     if im.n_channels == 1:
         return True
-    for _ in range(n_sample_points):
+    pixels = im.pixels[:3]
+    if full:
+        return _is_greyscale_pixels(pixels, thresh=thresh, chunk_rows=chunk_rows)
+    if stride is not None:
+        pixels = pixels[:, ::stride, ::stride]
+    else:
         # sample random values for row, column check.
-        r = np.random.randint(0, im.shape[0])
-        c = np.random.randint(0, im.shape[1])
-        # # check whether they are (approximately) same
-        cond = (np.abs(im.pixels[0, r, c] - im.pixels[1, r, c]) < thresh and
-                np.abs(im.pixels[0, r, c] - im.pixels[2, r, c]) < thresh)
-        if not cond:
-            # Then an element of non grayscale value is found.
-            break
-    # If the loop is interrupted it has the value wrong.
-    return cond
+        r = np.random.randint(0, im.shape[0], size=n_sample_points)
+        c = np.random.randint(0, im.shape[1], size=n_sample_points)
+        pixels = pixels[:, r, c][:, None]
+    return _is_greyscale_pixels(pixels, thresh=thresh, chunk_rows=chunk_rows)
+
+
+def _check_greyscale_file(p_im, thresh=0.001, rewrite=False):
+    """
+    Checks (all the pixels of) an image file and optionally rewrites it as
+    single-channel; it runs in a worker process of find_greyscale_images().
+    The rewritten image keeps only the pixels, i.e. the ancillary chunks of the
+    png (gamma, icc profile, text) are dropped.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by find_greyscale_images().
+    """
+    im = mio.import_image(p_im)
+    is_grey = check_if_greyscale_values(im, thresh=thresh, full=True)
+    if is_grey and rewrite and im.n_channels > 1:
+        # # only the 8-bit rgb images of lossless formats are rewritten (and
+        # # only if the channels are exactly equal), so that the values are
+        # # kept intact; e.g. the jpeg would be re-encoded, the alpha dropped.
+        from PIL import Image as PILImage
+        with PILImage.open(p_im) as im1:
+            if im1.format not in ('PNG', 'BMP') or im1.mode != 'RGB':
+                return is_grey
+            pixels, fmt = np.asarray(im1), im1.format
+        if np.all(pixels[..., 1:] == pixels[..., :1]):
+            # # through a temp file, an interruption does not corrupt the image.
+            im_grey = PILImage.fromarray(pixels[..., 0])
+            _replace_atomically(p_im, lambda fp: im_grey.save(fp, format=fmt))
+    return is_grey
+
+
+def find_greyscale_images(p_in, extensions=('png', 'jpg', 'jpeg'), thresh=0.001,
+                          rewrite=False, max_workers=None, chunksize=16):
+    """
+    Scans the images of a folder (in a process pool) and finds the ones that
+    are truly greyscale, i.e. all their pixels have the same values over the
+    channels. Optionally, the 3-channel greyscale ones are rewritten as
+    single-channel (smaller files, faster to load); only the 8-bit rgb png/bmp
+    images are rewritten (atomically, without their ancillary chunks, e.g.
+    gamma/icc/text), the lossy (jpeg), alpha or 16-bit ones are left intact.
+    :param p_in: (str) The folder with the images.
+    :param extensions: (tuple, optional) The extensions of the images.
+    :param thresh: (float, optional) The threshold for similarity (normalised values).
+    :param rewrite: (bool, optional) If True, overwrite the greyscale images as single-channel.
+    :param max_workers: (int, optional) Number of processes.
+    :param chunksize: (int, optional) Images per task sent to the processes.
+    :return: (list) The paths of the greyscale images.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    assert(isdir(p_in))
+    ext = tuple('.' + e for e in extensions)
+    with os.scandir(p_in) as it:
+        paths = sorted(e.path for e in it if e.name.lower().endswith(ext) and e.is_file())
+    func = partial(_check_greyscale_file, thresh=thresh, rewrite=rewrite)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        res = list(executor.map(func, paths, chunksize=chunksize))
+    return [p for p, is_grey in zip(paths, res) if is_grey]
 
 
 def pad_img(im, sht, force_shape=True):
@@ -235,7 +717,18 @@ def pad_with_same_aspect_ratio(im, shtarget1, max_rescale=2., return_info=False)
     return im1
 
 
-def get_segment_image(im, n_segment, n_total, axis=1):
+def _segment_view(pixels, n_segment, sh1, axis):
+    """
+    Returns the (1-based) n_segment of sh1 elements along axis as a view of the pixels.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by get_segment_image() and iter_segments().
+    """
+    slc = [slice(None)] * pixels.ndim
+    slc[axis] = slice((n_segment - 1) * sh1, n_segment * sh1)
+    return pixels[tuple(slc)]
+
+
+def get_segment_image(im, n_segment, n_total, axis=1, copy=True):
     """
     Returns the segment of the image requested. This is the reverse of
     concatenate, i.e. given a (concatenated) image, it divides it into
@@ -244,20 +737,53 @@ def get_segment_image(im, n_segment, n_total, axis=1):
     :param n_segment: (int) The segment to return, 1-based.
     :param n_total: (int) Total number of segments to divide the image.
     :param axis: (int)
+    :param copy: (bool, optional) If False, the segment is returned as a view of the
+        pixels (numpy array), since the menpo images copy non C-contiguous data.
     :return: Segment of the image (menpo image type).
     """
     sh1 = im.pixels.shape[axis] // n_total
     if im.pixels.shape[axis] % n_total != 0:
         print('Not exact division into segments.')
-    if axis == 1:
-        px = im.pixels[:, (n_segment - 1) * sh1: n_segment * sh1, :]
-    elif axis == 2:
-        px = im.pixels[:, :, (n_segment - 1) * sh1: n_segment * sh1]
-    else:
-        px = im.pixels[(n_segment - 1) * sh1: n_segment * sh1]
+    px = _segment_view(im.pixels, n_segment, sh1, axis)
+    if not copy:
+        return px
     return Image(px)
 
 
+def iter_segments(im, n_total, axis=1):
+    """
+    Generator version of get_segment_image(), it yields all the segments of the
+    image (in one pass) as views of the pixels (numpy arrays), i.e. without copies.
+    :param im: Menpo type image (channels in front).
+    :param n_total: (int) Total number of segments to divide the image.
+    :param axis: (int)
+    :return: The segments (numpy views).
+    """
+    sh1 = im.pixels.shape[axis] // n_total
+    if im.pixels.shape[axis] % n_total != 0:
+        print('Not exact division into segments.')
+    for n_segment in range(1, n_total + 1):
+        yield _segment_view(im.pixels, n_segment, sh1, axis)
+
+
+def get_segments_stacked(im, n_total, axis=1):
+    """
+    Returns all the segments of the image stacked, i.e. the (n_total, C, h, w)
+    matrix, as a single (reshaped) view of the pixels. The image should be
+    exactly divisible into segments.
+    :param im: Menpo type image (channels in front).
+    :param n_total: (int) Total number of segments to divide the image.
+    :param axis: (int)
+    :return: (numpy matrix) The stacked segments.
+    """
+    px = im.pixels
+    sh, axis = px.shape, axis % px.ndim
+    assert sh[axis] % n_total == 0, 'Not exact division into segments.'
+    new_sh = sh[:axis] + (n_total, sh[axis] // n_total) + sh[axis + 1:]
+    # # move the new segment axis in front.
+    return np.moveaxis(px.reshape(new_sh), axis, 0)
+
+
 def _info_from_first_line(line):
     """
     Gets the info from the first line of landmarks' txt. The format of the file
@@ -298,7 +824,45 @@ def _from_line_to_vec(line, vec_sz):
     line_vec = line[line.find('\t') + 1:]
     # # convert the string into a numpy vector and return it.
     # # The separator is hardcoded based on the export code.
-    return np.fromstring(line_vec, sep=', ', count=vec_sz)
+    return np.array(line_vec.split(',')[:vec_sz], dtype=np.float64)
+
+
+def _read_txt_data(pln_txt):
+    """
+    Returns the content (bytes) of a txt provided as a path, a file object or
+    directly as bytes.
+    """
+    if isinstance(pln_txt, bytes):
+        return pln_txt
+    if hasattr(pln_txt, 'read'):
+        data = pln_txt.read()
+        return data.encode('latin1') if isinstance(data, str) else data
+    with open(pln_txt, 'rb') as fp:
+        return fp.read()
+
+
+def _parse_txt_lines(body, vec_sz, max_rows=None):
+    """
+    Parses the lines (after the first one) of the landmarks' txt in a single
+    vectorized pass. Each line is of the format '[frame]::[name]\t[numbers]'.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by the from_txt_to_numpy_points().
+    :param body: (bytes) The lines of the txt.
+    :param vec_sz: (int) Number of numbers expected in each line.
+    :param max_rows: (int, optional) If provided, only these lines are parsed.
+    :return: i) the frame numbers (int array), ii) the numbers (float64 array with a
+        row per line).
+    """
+    if len(body.strip()) == 0:
+        return np.zeros((0,), dtype=np.int64), np.zeros((0, vec_sz))
+    # # convert the head of each line into fields, i.e. '[frame],[name],[numbers]'.
+    body = body.replace(b'::', b',').replace(b'\t', b',')
+    # # the numbers are converted (float64 similar to the per line parsing) by the
+    # # C parser of loadtxt; the (possible) trailing separator is ignored.
+    cols = [0] + list(range(2, vec_sz + 2))
+    values = np.loadtxt(io.BytesIO(body), delimiter=',', usecols=cols,
+                        max_rows=max_rows, ndmin=2)
+    return values[:, 0].astype(np.int64), values[:, 1:]
 
 
 def from_txt_to_numpy_points(pln_txt, return_only_first=False):
@@ -310,16 +874,18 @@ def from_txt_to_numpy_points(pln_txt, return_only_first=False):
     the meta-data and the actual numbers. Those functions have hardcoded
     assumptions regarding the txt format, e.g.
     the first frame info, the format of every line.
-    :param pln_txt: (str) Path of the txt file to be parsed.
+    All the lines are parsed in a single pass and scattered in the matrix.
+    :param pln_txt: (str, file object or bytes) Path of the txt file to be parsed,
+        or the opened file, or its content.
     :param return_only_first: (bool, optional) If True, it just returns the first
         frames points. This is a convenience arg for quick access. Default: False.
     :return: i) the numpy matrix with the points, ii) a dict with the
         meta-data info, iii) positions that it found valid points (which might
         not be sequential).
     """
-    txt = open(pln_txt, 'rt')
-    lines = txt.readlines()
-    info = _info_from_first_line(lines[0])
+    data = _read_txt_data(pln_txt)
+    pos = data.find(b'\n') + 1
+    info = _info_from_first_line(data[:pos].decode('latin1'))
     # # get the size of the vectorized landmark points.
     vec_sz = info['n_landm'] * 2
 
@@ -329,26 +895,204 @@ def from_txt_to_numpy_points(pln_txt, return_only_first=False):
     points_np = np.zeros((info['n_frames'], info['n_landm'], 2), dtype=np.float32)
 
     # # positions_found: The positions (relative to the first frame) that we
-    # # found landmarks on.
-    positions_found = []
+    # # found landmarks on; the row of points_np declares the ascending number
+    # # of the frame.
+    max_rows = 1 if return_only_first else None
+    positions_found, values = _parse_txt_lines(data[pos:], vec_sz, max_rows=max_rows)
+    points_np[positions_found] = values.reshape((-1, info['n_landm'], 2))
+    return points_np, info, positions_found.tolist()
 
-    # # Iterate over all the lines and export the points in the points_np.
-    # # The iterator starts from -1, in order to ignore the first dummy row.
-    for cnt, line in enumerate(lines):
-        if cnt == 0:
-            continue
-        if return_only_first and cnt >= 2:
+
+def _txt_cache_paths(pln_txt, cache_dir=None):
+    """
+    Returns the key (path + size + mtime) of a txt and the paths of its cached
+    points (.npy) and meta-data (.json).
+    """
+    from hashlib import sha1
+    st = os.stat(pln_txt)
+    key = '{}:{}:{}'.format(os.path.abspath(pln_txt), st.st_size, st.st_mtime_ns)
+    if cache_dir is None:
+        p_base = pln_txt
+    else:
+        p_base = join(cache_dir, sha1(key.encode('utf-8')).hexdigest())
+    return key, p_base + '.npy', p_base + '.json'
+
+
+def _replace_atomically(p_out, write, mode='wb'):
+    """
+    Writes a file through a unique temp file (in the same folder) that replaces
+    p_out when complete, i.e. concurrent writers never see a partial file.
+    :param write: (function) Accepts the opened temp file and writes the content.
+    """
+    import uuid
+    p_tmp = '{}.tmp_{}_{}'.format(p_out, os.getpid(), uuid.uuid4().hex)
+    try:
+        with open(p_tmp, mode) as fp:
+            write(fp)
+        os.replace(p_tmp, p_out)
+    except BaseException:
+        if isfile(p_tmp):
+            os.remove(p_tmp)
+        raise
+
+
+def _evict_txt_cache(cache_dir, max_cache_bytes):
+    """
+    Removes the least recently used entries of the cache dir, till its size is
+    at most max_cache_bytes.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.npy'):
+            p_json = entry.path[:-4] + '.json'
+            size = entry.stat().st_size + (os.path.getsize(p_json) if isfile(p_json) else 0)
+            entries.append((entry.stat().st_mtime, size, entry.path, p_json))
+    total = sum(el[1] for el in entries)
+    for _, size, p_npy, p_json in sorted(entries):
+        if total <= max_cache_bytes:
             break
-        pt = _from_line_to_vec(line, vec_sz)
-        # # get the actual number of frame that these points correspond to.
-        cnt1 = int(line[:line.find('::')])
-        # # assign the point after reshaped to the appropriate position (row declares
-        # # the ascending number of the frame).
-        points_np[cnt1] = pt.reshape((-1, 2))
-        positions_found.append(cnt1)
+        for p in (p_json, p_npy):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        total -= size
+
+
+def from_txt_to_numpy_points_cached(pln_txt, cache_dir=None, max_cache_bytes=None,
+                                    mmap_mode='r'):
+    """
+    Cached version of from_txt_to_numpy_points(). The first call parses the txt
+    and exports the results in a binary sidecar (.npy with the points, .json with
+    the meta-data), the next calls memory-map the points without parsing.
+    The sidecar is keyed by the path, size and modification time of the txt,
+    i.e. it is re-created if the txt changes.
+    :param pln_txt: (str) Path of the txt file to be parsed.
+    :param cache_dir: (str, optional) Folder of the cache. If None, the sidecar
+        files are exported next to the txt ([pln_txt].npy, [pln_txt].json).
+    :param max_cache_bytes: (int, optional) If provided (along with cache_dir), the
+        least recently used entries are evicted to keep the cache dir below this size.
+    :param mmap_mode: (str, optional) The mmap_mode of np.load(); if None, the points
+        are loaded in memory.
+    :return: Same as from_txt_to_numpy_points().
+    """
+    import json
+    key, p_npy, p_json = _txt_cache_paths(pln_txt, cache_dir=cache_dir)
+    if isfile(p_json):
+        with open(p_json, 'rt') as fp:
+            meta = json.load(fp)
+        if meta['key'] == key and isfile(p_npy):
+            try:
+                # # mark it as recently used (for the eviction).
+                os.utime(p_npy)
+            except OSError:
+                pass
+            points_np = np.load(p_npy, mmap_mode=mmap_mode)
+            return points_np, meta['info'], meta['positions_found']
+
+    points_np, info, positions_found = from_txt_to_numpy_points(pln_txt)
+    meta = {'key': key, 'info': info, 'positions_found': positions_found}
+    try:
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        # # export through temp files, the json (written last) marks a valid entry.
+        _replace_atomically(p_npy, lambda fp: np.save(fp, points_np))
+        _replace_atomically(p_json, lambda fp: json.dump(meta, fp), mode='wt')
+        if cache_dir is not None and max_cache_bytes is not None:
+            _evict_txt_cache(cache_dir, max_cache_bytes)
+    except OSError:
+        # # e.g. read-only dataset, the parsed result is still returned.
+        pass
     return points_np, info, positions_found
 
 
+def build_txt_frame_index(pln_txt, persist=True):
+    """
+    Builds the byte-offset index of a landmarks' txt, i.e. the position of the
+    line of every frame, so that single frames can be read directly (see
+    read_txt_frames()). The index is persisted next to the txt ([pln_txt].offsets.npz)
+    and re-used while the txt (path, size, mtime) is the same.
+    :param pln_txt: (str) Path of the txt file.
+    :param persist: (bool, optional) If True, the index is loaded from/exported to disk
+        (if the export fails, e.g. read-only folder, the index is only returned).
+    :return: (dict) The 'info' of the txt (as in from_txt_to_numpy_points()) and the
+        'starts', 'ends' (int arrays of n_frames) byte offsets of the frames' lines;
+        -1 for the frames without landmarks.
+    """
+    key, _, _ = _txt_cache_paths(pln_txt)
+    p_index = pln_txt + '.offsets.npz'
+    if persist and isfile(p_index):
+        with np.load(p_index) as index:
+            if str(index['key']) == key:
+                info = {k: int(index[k]) for k in ('init_framename', 'n_frames', 'n_landm')}
+                return {'info': info, 'starts': index['starts'], 'ends': index['ends']}
+
+    data = _read_txt_data(pln_txt)
+    # # the start of every line (and the end as the start of the next).
+    nl = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+    line_starts = np.concatenate(([0], nl + 1))
+    line_ends = np.append(nl + 1, len(data))
+    info = _info_from_first_line(data[:line_ends[0]].decode('latin1'))
+    starts = -np.ones(info['n_frames'], dtype=np.int64)
+    ends = -np.ones(info['n_frames'], dtype=np.int64)
+    for st, en in zip(line_starts[1:], line_ends[1:]):
+        pos = data.find(b'::', st, en)
+        if pos > 0:
+            frame = int(data[st:pos])
+            starts[frame], ends[frame] = st, en
+    if persist:
+        try:
+            _replace_atomically(p_index, lambda fp: np.savez(fp, key=key, starts=starts,
+                                                             ends=ends, **info))
+        except OSError:
+            # # e.g. read-only clip folder, the index is only kept in memory.
+            pass
+    return {'info': info, 'starts': starts, 'ends': ends}
+
+
+def read_txt_frames(pln_txt, frames, index=None):
+    """
+    Reads only the requested frames of a landmarks' txt, by seeking to their
+    lines with the byte-offset index (see build_txt_frame_index()).
+    :param pln_txt: (str) Path of the txt file.
+    :param frames: (int, list, range or slice) The positions (relative to the first
+        frame, i.e. rows of from_txt_to_numpy_points()) of the frames to read.
+    :param index: (dict, optional) The output of build_txt_frame_index(). If None,
+        it is loaded (or built on the first call).
+    :return: i) the points (k, n_landm, 2) of the frames, ii) a dict with the
+        meta-data info, iii) boolean mask of the frames that contain landmarks.
+    """
+    if index is None:
+        index = build_txt_frame_index(pln_txt)
+    info = index['info']
+    if isinstance(frames, slice):
+        frames = range(*frames.indices(info['n_frames']))
+    frames = np.atleast_1d(np.asarray(frames, dtype=np.int64))
+    starts, ends = index['starts'][frames], index['ends'][frames]
+    found = starts >= 0
+    points_np = np.zeros((len(frames), info['n_landm'], 2), dtype=np.float32)
+    if not np.any(found):
+        return points_np, info, found
+    starts, ends = np.unique(starts[found]), np.unique(ends[found])
+    with open(pln_txt, 'rb') as fp:
+        if np.array_equal(starts[1:], ends[:-1]):
+            # # the lines are consecutive (e.g. a range), read them as a block.
+            fp.seek(starts[0])
+            body = fp.read(ends[-1] - starts[0])
+        else:
+            body = []
+            for st, en in zip(starts, ends):
+                fp.seek(st)
+                body.append(fp.read(en - st).rstrip(b'\n') + b'\n')
+            body = b''.join(body)
+    frames_read, values = _parse_txt_lines(body, info['n_landm'] * 2)
+    # # map every line read back to the requested positions.
+    rows = {fr: cnt for cnt, fr in enumerate(frames_read)}
+    sel = np.array([rows[fr] for fr in frames[found]])
+    points_np[found] = values[sel].reshape((-1, info['n_landm'], 2))
+    return points_np, info, found
+
+
 def access_ln_frame(points, info_txt, idx=None, frame_name=None,
                     allow_fail=True, eps=1e-4):
     """
@@ -392,21 +1136,172 @@ def access_ln_frame(points, info_txt, idx=None, frame_name=None,
     return PointCloud(pt)
 
 
-def concatenate_all_ims_from_list(ims, axis=-1):
+def access_ln_frames(points, info_txt, idx=None, frame_names=None, eps=1e-4,
+                     as_pointclouds=False):
+    """
+    Batch version of access_ln_frame(). Given a numpy 3D matrix (e.g. landmark
+    points for the whole clip) and the indices OR the frame names, it gathers the
+    landmarks of those frames and checks (in a single reduction) which of them
+    are valid, i.e. exist and are not all (almost) zero.
+
+    :param points: (numpy matrix) The matrix that contains the data.
+    :param info_txt: (dict) Dictionary with meta-data.
+    :param idx:  (list or array, optional) The indices of the frames.
+    :param frame_names: (list, optional) Either provide this or the idx, the
+        frame names (stems with only numbers) of the frames.
+    :param eps: (float, optional) Accuracy to ensure that the landmark
+        does not include zeros (considered dummy).
+    :param as_pointclouds: (bool, optional) If True, a generator of PointClouds
+        (None for the invalid frames) is returned as a third output; the
+        PointClouds are built lazily, i.e. while iterating over it.
+    :return: i) the (k, n_landm, 2) landmarks (zeros for the frames outside
+        of the matrix), ii) the boolean validity mask.
+    """
+    if idx is None:
+        # # same assumptions as in access_ln_frame() for the frame names.
+        idx = np.array([int(fr) for fr in frame_names]) - info_txt['init_framename']
+    idx = np.atleast_1d(np.asarray(idx, dtype=np.int64))
+    exists = (idx >= -points.shape[0]) & (idx < points.shape[0])
+    pts = np.zeros((len(idx),) + points.shape[1:], dtype=points.dtype)
+    pts[exists] = points[idx[exists]]
+    # # a frame is invalid if all its landmarks are almost zero.
+    axes = tuple(range(1, pts.ndim))
+    valid = exists & ~np.all(np.abs(pts) < eps, axis=axes)
+    if as_pointclouds:
+        pcs = (PointCloud(pt) if v else None for pt, v in zip(pts, valid))
+        return pts, valid, pcs
+    return pts, valid
+
+
+def clip_points_to_bbs(points, valid=None, minmax=False, eps=1e-4):
+    """
+    Vectorized version of from_ln_to_bb_path() for a whole clip, e.g. the
+    matrix returned by from_txt_to_numpy_points(). The tightest bounding box of
+    every frame is computed with a single min/max reduction.
+    :param points: (numpy matrix) The (n_frames, n_landm, 2) landmarks.
+    :param valid: (array, optional) Boolean mask with the frames that have
+        landmarks. If None, the frames with all the landmarks (almost) zero are
+        considered missing (same as access_ln_frames()).
+    :param minmax: (bool, optional) If True, the boxes are returned in the
+        (n_frames, 4) [y_min, x_min, y_max, x_max] format, otherwise as (n_frames, 4, 2)
+        points in the order of the menpo bounding_box().
+    :param eps: (float, optional) Accuracy for the missing frames if valid is None.
+    :return: i) the bounding boxes (zeros for the missing frames), ii) the mask.
+    """
+    if valid is None:
+        valid = ~np.all(np.abs(points) < eps, axis=(1, 2))
+    valid = np.asarray(valid, dtype=bool)
+    mins, maxs = points.min(axis=1), points.max(axis=1)
+    mins[~valid], maxs[~valid] = 0, 0
+    if minmax:
+        return np.concatenate((mins, maxs), axis=1), valid
+    # # same order as the menpo bounding_box(): clockwise from the min corner.
+    bbs = np.stack((mins, np.stack((maxs[:, 0], mins[:, 1]), axis=1), maxs,
+                    np.stack((mins[:, 0], maxs[:, 1]), axis=1)), axis=1)
+    return bbs, valid
+
+
+def export_clip_bbs(bbs, p_out, info_txt, valid=None, n_zeros=6, overwrite=False):
+    """
+    Exports in bulk the bounding boxes of a clip (e.g. from clip_points_to_bbs())
+    as pts files, one per (valid) frame, in the same format as the menpo
+    exporter (x-axis first, 1-based). The files are named after the frame names,
+    i.e. init_framename + index padded with n_zeros.
+    :param bbs: (numpy matrix) The (n_frames, 4, 2) bounding boxes.
+    :param p_out: (str) The output path.
+    :param info_txt: (dict) Dictionary with meta-data (see from_txt_to_numpy_points()).
+    :param valid: (array, optional) Boolean mask with the frames to export.
+    :param n_zeros: (int, optional) Padding of the frame names.
+    :param overwrite: (bool, optional) Whether to overwrite existing files in p_out.
+    :return: (int) The number of files written.
+    """
+    assert(isdir(p_out))
+    idx = np.arange(len(bbs)) if valid is None else np.flatnonzero(valid)
+    # # format all the boxes at once; each line of pts is 'x y'.
+    pts = bbs[idx][:, :, ::-1] + 1
+    line = ' '.join(['%.3f'] * 2) + '\n'
+    body = 'version: 1\nn_points: {}\n{{\n'.format(bbs.shape[1])
+    fmt = body + line * bbs.shape[1] + '}\n'
+    name = '{:0' + str(n_zeros) + 'd}.pts'
+    n_written = 0
+    for i, pt in zip(idx, pts.reshape(len(idx), -1)):
+        p1 = join(p_out, name.format(info_txt['init_framename'] + i))
+        if not overwrite and isfile(p1):
+            continue
+        with open(p1, 'w') as f:
+            f.write(fmt % tuple(pt))
+        n_written += 1
+    return n_written
+
+
+def _allocate_pixels(shape, dtype, out=None):
+    """
+    Allocates the output matrix of the concatenation functions, either in memory
+    or (if out is a path) as a .npy memmap.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by concatenate_all_ims_from_list() and montage_ims_from_list().
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+    assert out.shape == shape, 'The output should be of shape {}.'.format(shape)
+    return out
+
+
+def concatenate_all_ims_from_list(ims, axis=-1, out=None):
     """
     Given a list of images (should be of the same size), it
     concatenates all of them in a single image.
+    The output is allocated once and each image is copied in its slot.
     :param ims:   (list, images) List of images to concatenate.
     :param axis:  (int, optional) The axis to concatenate ims. For typical images
     if -1 it concatenates them horizontally, if 1 then concatenate vertically.
+    :param out:   (numpy matrix or str, optional) The matrix to write the pixels
+    in or the path of a .npy file to create as a memmap (for huge outputs).
     :return: Concatenated menpo image.
     """
-    conc = []
+    ims = list(ims)
+    sh0 = ims[0].pixels.shape
+    axis = axis % len(sh0)
+    shape = list(sh0)
+    shape[axis] = sum(im.pixels.shape[axis] for im in ims)
+    conc = _allocate_pixels(tuple(shape), ims[0].pixels.dtype, out=out)
+    slc, start = [slice(None)] * len(sh0), 0
+    for im in ims:
+        slc[axis] = slice(start, start + im.pixels.shape[axis])
+        conc[tuple(slc)] = im.pixels
+        start = slc[axis].stop
+    return Image(conc, copy=False)
+
+
+def montage_ims_from_list(ims, n_cols=None, pad=0, pad_value=0., out=None):
+    """
+    Places the images in a 2D grid (montage), e.g. for a contact sheet of a clip.
+    Each cell has the size of the largest image; the images are placed in the
+    top-left corner of their cell and the rest is filled with pad_value.
+    :param ims:   (list, images) List of images (with the same number of channels).
+    :param n_cols: (int, optional) The number of columns of the grid. If None, the
+        grid is (approximately) square.
+    :param pad:   (int, optional) Pixels of padding around the cells.
+    :param pad_value: (float, optional) The value of the padding/empty cells.
+    :param out:   (numpy matrix or str, optional) The matrix to write the pixels
+        in or the path of a .npy file to create as a memmap.
+    :return: The montage as a menpo image.
+    """
+    ims = list(ims)
+    if n_cols is None:
+        n_cols = int(np.ceil(np.sqrt(len(ims))))
+    n_rows = int(np.ceil(len(ims) / float(n_cols)))
+    n_ch = ims[0].pixels.shape[0]
+    h, w = np.max([im.pixels.shape[1:] for im in ims], axis=0)
+    shape = (n_ch, n_rows * (h + pad) + pad, n_cols * (w + pad) + pad)
+    mont = _allocate_pixels(shape, ims[0].pixels.dtype, out=out)
+    mont[:] = pad_value
     for cnt, im in enumerate(ims):
-        if cnt == 0:
-            conc = im.pixels.copy()
-        else:
-            conc = np.concatenate((conc, im.pixels), axis=axis)
-    return Image(conc)
+        r, c = divmod(cnt, n_cols)
+        y, x = pad + r * (h + pad), pad + c * (w + pad)
+        mont[:, y:y + im.pixels.shape[1], x:x + im.pixels.shape[2]] = im.pixels
+    return Image(mont, copy=False)
 
 
@@ -2,37 +2,183 @@
 # available under the terms of the Apache License, Version 2.0
 
 import os
-from os import system, listdir, walk
-from os.path import isdir, isfile, sep, join, getmtime
+from os import listdir, walk
+from os.path import isdir, isfile, join
 import shutil
 import errno
+import atexit
+import threading
+import uuid
+from functools import partial
 from glob import glob
-from subprocess import check_output
 from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 
 # TO-DO: put progress bars in all the packages with time-consuming loops.
 
-def mkdir_p(path, mode=500):
-    """ 'mkdir -p' in Python. """
+# # Process-local cache of the folders known to exist (see mkdir_p()).
+_known_dirs = set()
+_known_dirs_lock = threading.Lock()
+
+
+def _remember_dir(path):
+    """ Adds the (existing) folder and its parents to the cache of known folders. """
+    with _known_dirs_lock:
+        while path not in _known_dirs:
+            _known_dirs.add(path)
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+
+
+def _forget_dirs(path):
+    """ Removes a folder and its sub-folders from the cache of known folders. """
+    path = os.path.abspath(path)
+    prefix = join(path, '')
+    with _known_dirs_lock:
+        _known_dirs.difference_update([p for p in _known_dirs
+                                       if p == path or p.startswith(prefix)])
+
+
+def mkdir_p(path, mode=500, cache=False):
+    """
+    'mkdir -p' in Python.
+    :param path: (str) The path to create.
+    :param mode: (int, optional) The mode of the created folders.
+    :param cache: (bool, optional) If True, the path is created only if it is not
+        in the process-local cache of known folders (no syscalls otherwise).
+        Use it in loops where the folders are not deleted by other processes.
+    :return: The path.
+    """
+    p_abs = os.path.abspath(path)
+    if cache and p_abs in _known_dirs:
+        return path
     try:  # http://stackoverflow.com/a/11860637/1716869
         os.makedirs(path, mode=mode)
-        return path
     except OSError as exc:  # Python >2.5
-        if exc.errno == errno.EEXIST and isdir(path):
-            return path
-        else:
+        if not (exc.errno == errno.EEXIST and isdir(path)):
             raise
+    _remember_dir(p_abs)
+    return path
 
 
-def rm_if_exists(path):
+def mkdir_p_batch(paths, mode=500, cache=True):
     """
-    :param path: Path that will be removed (if it exists).
+    'mkdir -p' for many paths. The paths are deduplicated, the ones that are
+    parents of other paths are skipped (created implicitly), and if the parent of
+    a path is known to exist, a single mkdir is called for it.
+    :param paths: (list) The paths to create.
+    :param mode: (int, optional) The mode of the created folders.
+    :param cache: (bool, optional) If True, the paths in the process-local cache
+        of known folders are skipped (see mkdir_p()).
+    :return: (list) The paths.
     """
+    leaves = sorted({os.path.abspath(p) for p in paths})
+    # # a path is implicitly created if the next (sorted) path is its sub-folder.
+    leaves = [p for cnt, p in enumerate(leaves)
+              if cnt + 1 == len(leaves) or not leaves[cnt + 1].startswith(join(p, ''))]
+    for p in leaves:
+        if cache and p in _known_dirs:
+            continue
+        if os.path.dirname(p) in _known_dirs:
+            try:
+                os.mkdir(p, mode=mode)
+                _remember_dir(p)
+                continue
+            except FileNotFoundError:
+                # # the cache is outdated, fall back to creating the parents.
+                pass
+            except FileExistsError:
+                pass
+        mkdir_p(p, mode=mode)
+    return paths
+
+
+# # State of the background deletions (see rm_if_exists()).
+_deletion_pool = None
+_pending_deletions = set()
+_deletion_lock = threading.Lock()
+
+
+def _get_deletion_pool():
+    """ Returns the (lazily created) thread pool of the background deletions. """
+    global _deletion_pool
+    with _deletion_lock:
+        if _deletion_pool is None:
+            _deletion_pool = ThreadPoolExecutor(thread_name_prefix='rm_if_exists')
+            # # ensure that the trash is deleted before the interpreter exits.
+            atexit.register(flush_deletions)
+    return _deletion_pool
+
+
+def _forget_deletion(fut):
+    """ Done-callback that drops a finished deletion from the pending ones. """
+    with _deletion_lock:
+        _pending_deletions.discard(fut)
+
+
+def _schedule_deletion(path):
+    """
+    Moves the folder to a trash folder (next to it, i.e. on the same filesystem)
+    and schedules its deletion as a single task in the pool, i.e. the caller
+    does not wait for any scan of the folder.
+    A symlink is not followed (same as rmtree()), i.e. it is left untouched.
+    """
+    path = os.path.normpath(path)
+    if os.path.islink(path):
+        return
+    trash = join(os.path.dirname(path), '.trash_{}_{}'.format(os.path.basename(path),
+                                                              uuid.uuid4().hex))
     try:
-        shutil.rmtree(path)
+        os.rename(path, trash)
     except OSError:
-        pass
+        return
+    fut = _get_deletion_pool().submit(shutil.rmtree, trash, ignore_errors=True)
+    with _deletion_lock:
+        _pending_deletions.add(fut)
+    fut.add_done_callback(_forget_deletion)
+
+
+def rm_if_exists(path, background=False):
+    """
+    :param path: Path that will be removed (if it exists). A list of paths can
+                 be provided as well.
+    :param background: (optional) Boolean, if True, the path is atomically renamed
+                 to a trash folder and the function returns; the deletion is performed
+                 in a background thread (one per path). Call flush_deletions() to
+                 wait for those.
+    """
+    paths = path if isinstance(path, (list, tuple)) else [path]
+    for path in paths:
+        _forget_dirs(path)
+        if background:
+            # # the symlinks are skipped, rmtree() refuses them as well.
+            if isdir(path) and not os.path.islink(path):
+                _schedule_deletion(path)
+            continue
+        try:
+            shutil.rmtree(path)
+        except OSError:
+            pass
+
+
+def flush_deletions(timeout=None):
+    """
+    Waits for the background deletions of rm_if_exists() to finish.
+    :param timeout: (optional) Max number of seconds to wait.
+    :return: (int) The number of deletions that are still pending.
+    """
+    from concurrent.futures import wait
+    with _deletion_lock:
+        pending = list(_pending_deletions)
+    done, not_done = wait(pending, timeout=timeout)
+    with _deletion_lock:
+        # # the done-callbacks might not have run yet.
+        _pending_deletions.difference_update(done)
+    return len(not_done)
 
 
 def is_path(path, msg=None, stop_execution=False):
@@ -54,59 +200,263 @@ def is_path(path, msg=None, stop_execution=False):
     return True
 
 
-def remove_empty_paths(path, removeRoot=False, verbose=True):
+def _rmdir(path, dry_run=False):
+    """ Removes an (empty) folder; returns False if it was not removed. """
+    if dry_run:
+        return True
+    try:
+        os.rmdir(path)
+    except OSError:
+        # # e.g. a file was created meanwhile.
+        return False
+    return True
+
+
+def _remove_empty_subtree(path, dry_run=False):
+    """
+    Removes the empty folders of a subtree (including its root) bottom-up.
+    Each folder is scanned once (pre-order) and the folders are processed in
+    the reverse order, so every folder is decided after all its sub-folders.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by remove_empty_paths().
+    :param path: (str) The root of the subtree.
+    :param dry_run: (bool, optional) If True, nothing is removed.
+    :return: (list) The removed folders, the root (if removed) is the last one.
+    """
+    order, n_files, parent = [], {}, {path: None}
+    stack = [path]
+    while stack:
+        p = stack.pop()
+        order.append(p)
+        subdirs, files = _scan_dir_counts(p)
+        # # the sub-folders count as non-empty entries till they are removed.
+        n_files[p] = sum(files.values()) + len(subdirs)
+        for sub in subdirs:
+            parent[sub] = p
+        stack.extend(subdirs)
+
+    removed = []
+    for p in reversed(order):
+        if n_files[p] == 0 and _rmdir(p, dry_run=dry_run):
+            removed.append(p)
+            if parent[p] is not None:
+                n_files[parent[p]] -= 1
+    return removed
+
+
+def remove_empty_paths(path, removeRoot=False, verbose=True, index=None,
+                       dry_run=False, max_workers=None):
     """
     Removes empty folders recursively.
     It searches for empty sub-folders, deletes them and then searches the initial path.
+    Every folder is scanned once and the top-level sub-folders are processed
+    in parallel threads.
     :param path:         Initial path to remove empty (sub-)folders.
     :param removeRoot:  (optional) Boolean, if True, removes the initial path if empty.
     :param verbose:     (optional) Boolean, if True, prints info during execution.
-    :return:
+    :param index:       (optional) Path of a tree index (see tree_index.index_tree()).
+        If provided, the empty folders are found from the index.
+    :param dry_run:     (optional) Boolean, if True, the empty folders are only
+        reported (not removed).
+    :param max_workers: (optional) Int, number of threads for the sub-folders.
+    :return: (dict) The 'removed' folders (bottom-up) and the 'time' (in sec) spent.
     """
-    # code inspired from:
-    # http://www.jacobtomlinson.co.uk/2014/02/16/python-script-recursively-remove-empty-folders-directories/
+    import time
+    t0 = time.time()
+    report = {'removed': [], 'time': 0.}
     if not isdir(path):
         if verbose:
             print('The path {} does not exist.'.format(path))
-        return
+        return report
 
-    # recursively check for empty sub-folders and delete them if they are empty.
-    file_list = os.listdir(path)
-    if len(file_list):
-        for f in file_list:
-            new_path = join(path, f)
-            if isdir(new_path):
-                remove_empty_paths(new_path, removeRoot=True, verbose=verbose)
-
-    # if the (initial) folder is empty, delete it.
-    file_list = os.listdir(path)
-    if len(file_list) == 0 and removeRoot:
-        if verbose:
-            print('Removing the empty path: {}.'.format(path))
-        os.rmdir(path)
+    root = os.path.normpath(path)
+    if index is not None:
+        from .tree_index import index_empty_folders
+        # # the root (if empty) is the last one in the list.
+        removed = [p for p in index_empty_folders(index, path)
+                   if (p != root or removeRoot) and _rmdir(p, dry_run=dry_run)]
+    else:
+        subdirs, files = _scan_dir_counts(root)
+        removed = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for removed1 in executor.map(partial(_remove_empty_subtree, dry_run=dry_run),
+                                         subdirs):
+                removed.extend(removed1)
+        # # the sub-folders removed are the last elements of each subtree list.
+        n_subdirs_left = len(subdirs) - sum(os.path.dirname(p) == root for p in removed)
+        if (removeRoot and n_subdirs_left == 0 and sum(files.values()) == 0
+                and _rmdir(root, dry_run=dry_run)):
+            removed.append(root)
+
+    if not dry_run:
+        for p in removed:
+            _forget_dirs(p)
+    report['removed'] = removed
+    report['time'] = time.time() - t0
+    if verbose:
+        m1 = '{} {} empty paths in {:.2f} sec.'
+        print(m1.format('Found' if dry_run else 'Removed', len(removed), report['time']))
+    return report
+
+
+def _zero_copy(fd_in, fd_out, size):
+    """
+    Copies size bytes between two file descriptors inside the kernel, with
+    os.copy_file_range() or (if not available/supported) os.sendfile().
+    :return: (bool) True if the copy succeeded, False otherwise.
+    """
+    for fn_name in ('copy_file_range', 'sendfile'):
+        fn = getattr(os, fn_name, None)
+        if fn is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if fn_name == 'copy_file_range':
+                    sent = fn(fd_in, fd_out, size - offset, offset, offset)
+                else:
+                    sent = fn(fd_out, fd_in, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError:
+            # # e.g. different filesystems in old kernels, reset the output.
+            offset = -1
+        if offset == size:
+            return True
+        os.lseek(fd_out, 0, os.SEEK_SET)
+        os.ftruncate(fd_out, 0)
+    return False
+
+
+def _copy_file(src, dst):
+    """ Copies a file (content + metadata), with zero-copy transfers if possible. """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        if not _zero_copy(fsrc.fileno(), fdst.fileno(), size):
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, dst)
+
+
+def _is_identical(src, dst):
+    """ Same size and (whole seconds, similar to rsync) modification time. """
+    try:
+        st_src, st_dst = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    return (st_src.st_size == st_dst.st_size and
+            int(st_src.st_mtime) == int(st_dst.st_mtime))
+
+
+def _reflink(src, dst):
+    """
+    Clones a file with copy-on-write (FICLONE ioctl, e.g. btrfs, xfs), or
+    copies it if the filesystem does not support it.
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            # # FICLONE from linux/fs.h.
+            fcntl.ioctl(fdst.fileno(), 0x40049409, fsrc.fileno())
+        shutil.copystat(src, dst)
+    except (ImportError, OSError):
+        _copy_file(src, dst)
+
+
+def _transfer_file(src, dst, mode='copy'):
+    """
+    Transfers a single file to dst (overwritten if it exists).
+    :param src: (str) Path of the file to transfer.
+    :param dst: (str) Destination path of the file.
+    :param mode: (str, optional) One of 'copy', 'hardlink', 'symlink', 'reflink'.
+    :return:
+    """
+    if os.path.lexists(dst):
+        # # unlink first, dst might be a (hard/sym)link to src.
+        os.unlink(dst)
+    if mode == 'hardlink':
+        os.link(src, dst)
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+    elif mode == 'reflink' and not os.path.islink(src):
+        _reflink(src, dst)
+    elif os.path.islink(src):
+        # # similar to 'cp -r', the links are copied as links.
+        os.symlink(os.readlink(src), dst)
+    else:
+        _copy_file(src, dst)
 
 
-def copy_contents_of_folder(src, dest, suffix=''):
+def copy_contents_of_folder(src, dest, suffix='', mode='copy', skip_identical=False,
+                            max_workers=None):
     """
     Performs the unix command of 'cp -r [path_0]/*[suffix] [path_1]'.
+    The files are transferred in parallel threads, without calling the shell.
     :param src: (str) Path to copy from.
-    :param dest: (str) Path to copy to.
+    :param dest: (str) Path to copy to. It is created if it does not exist.
     :param suffix: (Optional, str) The suffix/extension of the files.
-    :return:
+    :param mode: (Optional, str) 'copy' for copying the files, 'hardlink' or
+           'symlink' for linking them instead, 'reflink' for copy-on-write clones.
+    :param skip_identical: (Optional, bool) If True, the files that exist in dest with
+           the same size and modification time are skipped.
+    :param max_workers: (Optional, int) Number of threads for the transfers.
+    :return: (dict) The number of files 'copied', 'skipped' and the 'errors'
+           as a list of (path, error message) tuples.
     """
     assert (isdir(src))
-    system('cp -r {}{}*{} {}'.format(src, sep, suffix, dest))
+    assert mode in ('copy', 'hardlink', 'symlink', 'reflink'), 'Unknown mode {}.'.format(mode)
+    mkdir_p(dest)
+    # # form the list of files to transfer; the folders are created here.
+    transfers = []
+    with os.scandir(src) as it:
+        # # same as the glob src/*suffix, i.e. the hidden entries are skipped.
+        matched = [entry for entry in it if entry.name.endswith(suffix) and
+                   not entry.name.startswith('.')]
+    for entry in matched:
+        dst = join(dest, entry.name)
+        if not entry.is_dir(follow_symlinks=False):
+            transfers.append((entry.path, dst))
+            continue
+        for root, dirnames, filenames in walk(entry.path):
+            root_dst = join(dst, os.path.relpath(root, entry.path))
+            mkdir_p(root_dst)
+            transfers.extend((join(root, fn), join(root_dst, fn))
+                             for fn in filenames)
+            # # links to folders are also copied as links.
+            transfers.extend((join(root, dn), join(root_dst, dn))
+                             for dn in dirnames if os.path.islink(join(root, dn)))
+
+    def _transfer(paths):
+        if skip_identical and _is_identical(*paths):
+            return 'skipped', None
+        try:
+            _transfer_file(paths[0], paths[1], mode=mode)
+        except OSError as exc:
+            return 'errors', (paths[0], str(exc))
+        return 'copied', None
+
+    report = {'copied': 0, 'skipped': 0, 'errors': []}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for status, error in executor.map(_transfer, transfers):
+            if status == 'errors':
+                report['errors'].append(error)
+            else:
+                report[status] += 1
+    return report
 
 
 def _format_string_name_number(pad, name):
     return '{nam1:0{pad}d}'.format(pad=pad, nam1=name)
 
 
-def copy_the_previous_if_missing(p, expected_list=None, suffix=None, verbose=False):
+def copy_the_previous_if_missing(p, expected_list=None, suffix=None, verbose=False,
+                                 mode='copy', plan_only=False, max_workers=None):
     """
     Copies the previous file if it is missing. If the expected_list is provided, it
     ensures that all the filenames in the expected list exist in the p path as well.
     Use case: Fill the missing files, e.g. 1st order markov assumption.
+    The whole plan (source, target) is formed first, with the frame numbers
+    compared as integer arrays, and then it is executed in parallel threads.
     ASSUMPTIONS:
         a) The naming should be only numbers, e.g. '000034.[suffix]',
         b) The [suffix] of the first file (listdir) will be copied in case
@@ -118,9 +468,14 @@ def copy_the_previous_if_missing(p, expected_list=None, suffix=None, verbose=Fal
     :param suffix:  (string, optional) The suffix of the files to glob. If None is provided,
             then the extension of the first file is used.
     :param verbose: (bool, optional) Whether to print info for the copying.
-    :return:
+    :param mode:    (string, optional) How to fill a missing file: 'copy', 'hardlink',
+            'symlink' or 'reflink' (copy-on-write clone, falls back to a copy if
+            the filesystem does not support it).
+    :param plan_only: (bool, optional) If True, the plan is only returned (nothing copied).
+    :param max_workers: (int, optional) Number of threads for executing the plan.
+    :return: (list) The plan, i.e. a list of (source path, target path).
     """
-    from shutil import copy2
+    import numpy as np
 
     if suffix is None:
         init_l = sorted(listdir(p))
@@ -133,18 +488,18 @@ def copy_the_previous_if_missing(p, expected_list=None, suffix=None, verbose=Fal
     init_l = sorted(glob(p + '*' + suffix))
     assert len(init_l) >= 1
     init_l = [Path(el).stem for el in init_l]
+    init_int = np.array(init_l).astype(np.int64)
+    order = np.argsort(init_int)
+    init_int = init_int[order]
 
     if expected_list is None:
         # as a workaround, we accept the first and the last element
         # we find in the original list and then we just form the
         # expected list with those.
-        end_el = int(init_l[-1])
-        start_el = int(init_l[0])
+        exp_int = np.arange(init_int[0], init_int[-1])
         # get the number of digits from the length of the start_el.
         pad = len(init_l[0])
-        # format the expected list now.
-        expected_list = [_format_string_name_number(pad, el)
-                         for el in range(start_el, end_el)]
+        expected_list = None
     else:
         # ensure that there is no extension in the list provided.
         try:
@@ -152,136 +507,390 @@ def copy_the_previous_if_missing(p, expected_list=None, suffix=None, verbose=Fal
         except ValueError:
             # in this case, get rid of the extension.
             expected_list = [Path(el).stem for el in expected_list]
-    expected_list = sorted(expected_list)
-
-    # iterator counting the parsed elements of the init list.
-    cnt_init = 0
-    # ready to iterate over the expected list and if the respective
-    # element of the init_l is missing, copy the previous (or the next
-    # if the initia are missing).
-    for el_exp in expected_list:
-        if cnt_init >= len(init_l):
-            # we reached the end of the list, but there are more
-            # elements that should be copied.
-            # Trick, append a new element to the end, which is greater
-            # than al lin the expected list, ensure the rest are copied.
-            el1 = int(expected_list[-1]) + 5
-            init_l.append(_format_string_name_number(len(init_l[0]), el1))
-        if el_exp == init_l[cnt_init]:
-            # we have a match, no need to copy anything.
-            cnt_init += 1
-            continue
-        diff = int(el_exp) - int(init_l[cnt_init])
-        if diff > 0 and cnt_init < len(init_l) - 1:
-            # we need to fast forward the parsing of the second list
-            while diff > 0 and cnt_init < len(init_l) - 1:
-                cnt_init += 1
-                diff = int(el_exp) - int(init_l[cnt_init])
-        else:
-            # We actually need to copy the previous.
-            target = el_exp
-            if cnt_init == 0:
-                # corner case where the first is missing.
-                source = init_l[cnt_init]
-            else:
-                source = init_l[cnt_init - 1]
-            # format the filenames paths for the new (i.e. to be copied) and
-            # old (i.e. to copy)files.
-            p_src = p + source + suffix
-            p_trg = p + target + suffix
-            assert (isfile(p_src) and not isfile(p_trg))
-            if verbose:
-                print('Copying the file {} to the {}.'.format(p_src, p_trg))
-            copy2(p_src, p_trg)
+        expected_list = np.array(sorted(expected_list))
+        exp_int = expected_list.astype(np.int64)
 
+    # # the missing ones are copied from the previous existing (or the first
+    # # existing if there is no previous one).
+    pos = np.searchsorted(init_int, exp_int)
+    missing = (pos >= len(init_int)) | (init_int[np.minimum(pos, len(init_int) - 1)] != exp_int)
+    src_idx = order[np.maximum(pos[missing] - 1, 0)]
+    if expected_list is None:
+        targets = [_format_string_name_number(pad, el) for el in exp_int[missing]]
+    else:
+        targets = expected_list[missing]
+    # format the filenames paths for the new (i.e. to be copied) and
+    # old (i.e. to copy)files.
+    plan = [(p + init_l[s] + suffix, p + t + suffix) for s, t in zip(src_idx, targets)]
+    if plan_only:
+        return plan
+
+    def _fill(paths):
+        if verbose:
+            print('Copying the file {} to the {}.'.format(*paths))
+        _transfer_file(paths[0], paths[1], mode=mode)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_fill, plan))
+    return plan
 
-def unzip_all_dir(p, extension='zip'):
+
+def _clean_member_name(name):
+    """
+    Converts the name of an archive member to the relative path it is extracted
+    to, i.e. the drive, the absolute root and the '.', '..' components are
+    dropped (same as the ZipFile.extract()).
+    """
+    name = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        name = name.replace(os.path.altsep, os.path.sep)
+    name = os.path.splitdrive(name)[1]
+    return os.path.sep.join(x for x in name.split(os.path.sep)
+                            if x not in ('', os.path.curdir, os.path.pardir))
+
+
+def _is_extracted(p_out, name, size):
+    """ Whether a member (name, uncompressed size) already exists in p_out. """
+    p_member = join(p_out, _clean_member_name(name))
+    return isfile(p_member) and os.path.getsize(p_member) == size
+
+
+def _extract_members(p_archive, p_out, members=None, patterns=None, skip_existing=False):
+    """
+    Extracts (some of) the members of an archive; it runs in a worker process.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by unzip_all_dir().
+    :param p_archive: (string) Path of the archive.
+    :param p_out: (string) Path to extract to.
+    :param members: (list, optional) The names of the (zip) members to extract.
+    :param patterns: (list, optional) The (tar) members matching any pattern are extracted.
+    :param skip_existing: (bool, optional) If True, the members that exist with the
+           same size are skipped.
+    :return: (tuple) Number of the extracted and of the skipped members.
+    """
+    from zipfile import ZipFile, is_zipfile
+    import tarfile
+    n_extracted, n_skipped = 0, 0
+    if is_zipfile(p_archive):
+        with ZipFile(p_archive, 'r') as compr_ref:
+            for name in members:
+                info = compr_ref.getinfo(name)
+                if skip_existing and _is_extracted(p_out, name, info.file_size):
+                    n_skipped += 1
+                    continue
+                compr_ref.extract(info, p_out)
+                n_extracted += 1
+        return n_extracted, n_skipped
+    # right now only these two formats supported; the tar is streamed.
+    with tarfile.open(p_archive, 'r|*') as compr_ref:
+        for info in compr_ref:
+            if not _match_patterns(info.name, patterns):
+                continue
+            if skip_existing and info.isfile() and _is_extracted(p_out, info.name, info.size):
+                n_skipped += 1
+                continue
+            compr_ref.extract(info, p_out)
+            n_extracted += 1
+    return n_extracted, n_skipped
+
+
+def _match_patterns(name, patterns=None):
+    """ Whether the (base)name matches any of the glob patterns (or no patterns). """
+    from fnmatch import fnmatch
+    if patterns is None:
+        return True
+    return any(fnmatch(os.path.basename(name), pat) for pat in patterns)
+
+
+def unzip_all_dir(p, extension='zip', patterns=None, skip_existing=False,
+                  max_workers=None, task_size=2 ** 28):
     """
     Unzips all the zip folders in the directory.
+    The archives are extracted in parallel processes; the zip archives are
+    additionally split (by member) in tasks of ~task_size bytes, so that a single
+    large zip is extracted by several workers.
+    The format (zip or tar, with any compression) is detected from the content.
     :param p: (string) Path with all the zips.
     :param extension: (string, optional) The extension/compressed format 
            of the files.
-    :return: None
+    :param patterns: (list, optional) If provided, only the members whose filename
+           matches any of the (glob) patterns are extracted, e.g. ['*.png', '*.pts'].
+    :param skip_existing: (bool, optional) If True, the members that already exist in
+           p with the same size are not extracted again.
+    :param max_workers: (int, optional) Number of worker processes.
+    :param task_size: (int, optional) Uncompressed bytes of zip members per task.
+    :return: (tuple) Number of the extracted and of the skipped members.
     """
-    from zipfile import ZipFile
-    import tarfile
+    from zipfile import ZipFile, is_zipfile
+    from concurrent.futures import ProcessPoolExecutor
     m = 'There is no such path with zips (p = {}).'
     assert isdir(p), m.format(p)
-    all_zips = glob(join(p, '*.{}'.format(extension)))
+    all_zips = sorted(glob(join(p, '*.{}'.format(extension))))
+    tasks = []
     for zi in all_zips:
-        if extension == 'zip':
-            compr_ref = ZipFile(zi, 'r')
-        else:
-            # right now only these two formats supported.
-            compr_ref = tarfile.open(zi, 'r')
-        compr_ref.extractall(p)
-        compr_ref.close()
+        if not is_zipfile(zi):
+            tasks.append((zi, None))
+            continue
+        with ZipFile(zi, 'r') as compr_ref:
+            infos = [info for info in compr_ref.infolist()
+                     if _match_patterns(info.filename, patterns)]
+        # # create the folders here, the workers would race for them.
+        for folder in {os.path.dirname(_clean_member_name(info.filename)) for info in infos}:
+            mkdir_p(join(p, folder))
+        chunk, chunk_size = [], 0
+        for info in infos:
+            chunk.append(info.filename)
+            chunk_size += info.file_size
+            if chunk_size >= task_size:
+                tasks.append((zi, chunk))
+                chunk, chunk_size = [], 0
+        if len(chunk) > 0:
+            tasks.append((zi, chunk))
+
+    n_extracted, n_skipped = 0, 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_extract_members, zi, p, members=members,
+                                   patterns=patterns, skip_existing=skip_existing)
+                   for zi, members in tasks]
+        for fut in futures:
+            n1, n2 = fut.result()
+            n_extracted += n1
+            n_skipped += n2
+    return n_extracted, n_skipped
 
 
-def count_files(path='.', ending='', directory=False, subdirs=False):
+def _file_key(name):
+    """
+    Returns the key used for grouping the files in scan_counts(), i.e. the
+    part of the filename from the first dot onwards (e.g. '.png', '.tar.gz').
+    Hidden files are grouped by their whole name (e.g. '.bashrc'), files
+    without a dot are grouped under the key ''.
+    """
+    pos = name.find('.')
+    return name[pos:] if pos >= 0 else ''
+
+
+def _scan_dir_counts(path, key=_file_key):
+    """
+    Single scandir() pass over one directory.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by scan_counts().
+    :param path: (str) The directory to scan.
+    :param key: (function) Maps each filename to the key it is counted under.
+    :return: (tuple) The sub-directories (paths) and a Counter with the files per key.
+    """
+    subdirs, files = [], Counter()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                # # symlinks are not followed (same as find), they are counted as files.
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    files[key(entry.name)] += 1
+    except (PermissionError, FileNotFoundError):
+        pass
+    return subdirs, files
+
+
+def _scan_subtree_counts(path, key=_file_key):
+    """
+    Iteratively scans a whole subtree with _scan_dir_counts().
+    :param path: (str) The root of the subtree.
+    :param key: (function) Maps each filename to the key it is counted under.
+    :return: (dict) Same format as the scan_counts() output for the subtree.
+    """
+    counts = {}
+    stack = [path]
+    while stack:
+        p = stack.pop()
+        subdirs, files = _scan_dir_counts(p, key=key)
+        counts[p] = (len(subdirs), files)
+        stack.extend(subdirs)
+    return counts
+
+
+def scan_counts(path='.', subdirs=True, max_workers=None, key=_file_key):
+    """
+    Walks a path with os.scandir() and gathers in a single pass the number of
+    sub-folders and the number of files (per extension) of every folder visited.
+    The top-level sub-folders are walked in parallel threads, hence the result
+    can be computed once and then answer several count_files() queries.
+
+    :param path:    (string, optional) The base path to scan.
+    :param subdirs: (bool, optional) If False, only the base path is scanned
+        (not the subfolders).
+    :param max_workers: (int, optional) Number of threads for the subtrees. If None,
+        the default of concurrent.futures is used.
+    :param key: (function, optional) Maps each filename to the key it is counted
+        under. By default the extension, i.e. the part of the filename from the
+        first dot onwards, e.g. '.tar.gz'.
+    :return: (dict) Maps each folder (path) to a tuple of (number of sub-folders,
+        Counter with the number of files per key).
+    """
+    assert isdir(path), 'The initial path does not exist.'
+    path = os.path.normpath(path)
+    top_dirs, files = _scan_dir_counts(path, key=key)
+    counts = {path: (len(top_dirs), files)}
+    if not subdirs or len(top_dirs) == 0:
+        return counts
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for sub_counts in executor.map(partial(_scan_subtree_counts, key=key), top_dirs):
+            counts.update(sub_counts)
+    return counts
+
+
+def _name_ends_with(name, ending):
+    """ Key for scan_counts(), used by count_files() for the endings on the filenames. """
+    return name.endswith(ending)
+
+
+def count_files(path='.', ending='', directory=False, subdirs=False,
+                counts=None, max_workers=None, index=None):
     """
     It counts the files in the current directory and the subfolders.
     There is the options to count only in the current directory (and
     not in the subfolders), or to count only files with certain extensions.
+    The counting is performed in-process with scan_counts(); if the output of
+    a previous scan_counts() is provided, no filesystem access is required.
 
     :param path:   (string, optional) The base path to count the files in.
     :param ending: (string, optional) The extension/suffix of the files
-        to search for. Only makes sense if directory=False.
+        to search for, e.g. '.tar.gz' or '_mask.png' (matched against the end of
+        the filename). The endings that start with a dot are answered from the
+        counts per extension; the rest require a scan of the filenames, i.e.
+        the counts and the index are not used for them.
+        Only makes sense if directory=False.
     :param directory: (string, optional) If True, then it *only* counts the
-        number of directories (folders). The called one is also counted.
+        number of directories (folders), excluding the called one.
         If False, then it just counts the files.
     :param subdirs: (string, optional) If False, it counts only in this
         directory and not the subfolders. If True, it recursively counts
         the files in the subfolders as well.
+    :param counts: (dict, optional) The output of scan_counts(path) to answer
+        the query from. If subdirs=True, the scan should be recursive.
+    :param max_workers: (int, optional) Number of threads for scan_counts().
+    :param index: (str, optional) Path of a tree index (see tree_index.index_tree()).
+        If provided, the counts are answered from the index (except for the
+        endings without a leading dot, which require a scan of the filenames).
     :return: (int) The number of files.
     """
-    assert isdir(path), 'The initial path does not exist.'
-    # subtr is for avoiding counting the '.' and '..' paths.
-    subtr = 0
-    if not subdirs:
-        # in this case, we just care for the first
-        # level, apply the fastest method.
-        if ending == '':
-            cmd = 'ls -f {} | wc -l'.format(path)
-            subtr = 2
-        else:
-            # This is a workaround because ls -f [path]/* returns also
-            # the results of subfolders.
-            cmd = 'ls -f {}*{} | wc -l'.format(path, ending)
+    if ending != '' and not ending.startswith('.') and not directory:
+        # # the ending might span beyond the extension, count on the filenames.
+        counts = scan_counts(path, subdirs=subdirs, max_workers=max_workers,
+                             key=partial(_name_ends_with, ending=ending))
+        sel = counts.values() if subdirs else [counts[os.path.normpath(path)]]
+        return sum(files[True] for _, files in sel)
+    if counts is None and index is not None:
+        from .tree_index import index_counts
+        counts = index_counts(index, path)
+    if counts is None:
+        counts = scan_counts(path, subdirs=subdirs, max_workers=max_workers)
+    path = os.path.normpath(path)
+    assert path in counts, 'The initial path was not scanned.'
+    if subdirs:
+        # # the counts might be of a parent folder, keep only the subtree of path.
+        prefix = '' if path == os.curdir else join(path, '')
+        sel = [v for k, v in counts.items() if k == path or k.startswith(prefix)]
     else:
-        subtr = 1 if len(ending) == 0 else 0
-        add_arg = ''
+        sel = [counts[path]]
+
+    nr_files = 0
+    for n_dirs, files in sel:
         if directory:
-            add_arg = ' -type d '
-        cmd = 'find {}{} -name "*{}" -print | wc -l'.format(path, add_arg, ending)
-    nr_files = check_output(cmd, shell=True)
-    # get rid of the \n in the end and return.
-    return int(nr_files[:-1]) - subtr
+            nr_files += n_dirs
+        elif ending == '':
+            # # similar to 'ls', both the files and the folders are counted.
+            nr_files += n_dirs + sum(files.values())
+        else:
+            nr_files += sum(v for k, v in files.items() if k.endswith(ending))
+    return nr_files
+
+
+def _dir_mtimes(path, previous=None, only_dir=False):
+    """
+    Gathers the modification info of a single folder. If the folder's mtime
+    is the same as in the previous info, the previous info is returned as is,
+    i.e. the folder is not scanned.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by folders_last_modification().
+    :return: None if the folder does not exist, otherwise a tuple of (mtime_ns,
+        mtime, max mtime of the files if it is a leaf folder (or None), sub-folders).
+    """
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if previous is not None and previous[0] == st.st_mtime_ns:
+        return previous
+    subdirs, files, n_dirs = [], [], 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    # # similar to walk(), the links to folders are not followed.
+                    n_dirs += 1
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                else:
+                    files.append(entry)
+    except OSError:
+        # # unreadable (or just deleted) folder, skipped like in walk().
+        subdirs, files, n_dirs = [], [], 0
+    files_max = None
+    if not only_dir and n_dirs == 0 and len(files) > 0:
+        # # we are in a leaf folder, consider the files.
+        files_max = max(entry.stat().st_mtime for entry in files)
+    return st.st_mtime_ns, st.st_mtime, files_max, tuple(subdirs)
 
 
-def folders_last_modification(path, return_vars=True, verbose=True, only_dir=False):
+def folders_last_modification(path, return_vars=True, verbose=True, only_dir=False,
+                              index=None, snapshot=None, max_workers=None):
     """
     Iteratively computes the last modification of the files/subfolders
     in the path.
+    The folders of each level are processed in parallel threads. If a snapshot
+    is provided, the info of each folder is saved there and in the next calls
+    only the folders whose mtime changed are scanned again.
+    ASSUMPTION (snapshot): Modifying the content of an existing file does not
+    change the mtime of its folder, hence such modifications are not detected.
     :param path: (string) The path to check.
     :param return_vars: (bool, optional) If True, return the last modification.
                         This is returned in a datetime format.
     :param verbose:  (bool, optional) If True, print the last modification time.
     :param only_dir:  (bool, optional) If True, search also the filenames in 
                       the leaf folders ONLY.
+    :param index: (str, optional) Path of a tree index (see tree_index.index_tree()).
+                  If provided, the modification times are read from the index.
+    :param snapshot: (str, optional) Path of a (pickle) file with the per-folder
+                  modification info. It is created if it does not exist.
+    :param max_workers: (int, optional) Number of threads for the stat calls.
     :return:
     """
-    if only_dir:
-        last_mod = max(getmtime(root) for root,_,_ in walk(path))
+    if index is not None:
+        from .tree_index import index_last_modification
+        last_mod = index_last_modification(index, path, only_dir=only_dir)
     else:
-        last_mod = getmtime(path)
-        for root, dirname, filename in walk(path):
-            if len(dirname) == 0 and len(filename) > 0:
-                # # we are in a leaf folder, consider the files.
-                last_mod1 = max(getmtime(join(root, fn)) for fn in filename)
-                last_mod = max(last_mod, last_mod1)
-            # # get the modification of the root (folder); same as only_dir case.
-            last_mod = max(last_mod, getmtime(root))
+        root = os.path.normpath(path)
+        previous = {}
+        if snapshot is not None and isfile(snapshot):
+            from .auxiliary import import_pickle
+            snap = import_pickle(snapshot)
+            if snap['root'] == root and snap['only_dir'] == only_dir:
+                previous = snap['dirs']
+        dirs = {}
+        level = [root]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while level:
+                fn = lambda p: _dir_mtimes(p, previous.get(p), only_dir=only_dir)
+                for p, info in zip(level, executor.map(fn, level)):
+                    if info is not None:
+                        dirs[p] = info
+                level = [sub for p in level if p in dirs for sub in dirs[p][3]]
+        last_mod = max(max(info[1], info[2] or info[1]) for info in dirs.values())
+        if snapshot is not None:
+            from .auxiliary import export_pickle
+            export_pickle({'root': root, 'only_dir': only_dir, 'dirs': dirs}, snapshot)
     if verbose:
         import time
         print(time.ctime(last_mod))
@@ -290,13 +899,20 @@ def folders_last_modification(path, return_vars=True, verbose=True, only_dir=Fal
         return datetime.fromtimestamp(last_mod)
 
 
-def apply_fn_all_subfolders(pb, func):
+def apply_fn_all_subfolders(pb, func, index=None):
     """
     Applies a function in each folder and its subfolders (recursive calls).
     :param pb: (str) Base path.
     :param func: (function) The function to apply to each folder.
+    :param index: (str, optional) Path of a tree index (see tree_index.index_tree()).
+        If provided, the subfolders are read from the index.
     :return: -
     """
+    if index is not None:
+        from .tree_index import index_subfolders
+        for p in index_subfolders(index, pb):
+            func(p)
+        return
     func(pb)
     for fn in sorted(listdir(pb)):
         if isdir(pb + fn):
@@ -304,3 +920,77 @@ def apply_fn_all_subfolders(pb, func):
             print(fn)
             apply_fn_all_subfolders(join(pb, fn, ''), func)
 
+
+def _list_subfolders(pb, follow_symlinks=True):
+    """
+    Returns the folders in the order that apply_fn_all_subfolders() visits
+    them, i.e. depth-first with the sub-folders of each folder sorted.
+    If follow_symlinks is False, the links to folders are not visited.
+    """
+    folders, stack = [], [pb]
+    while stack:
+        p = stack.pop()
+        folders.append(p)
+        with os.scandir(p) as it:
+            subs = sorted(entry.name for entry in it
+                          if entry.is_dir(follow_symlinks=follow_symlinks))
+        stack.extend(join(p, fn, '') for fn in reversed(subs))
+    return folders
+
+
+def apply_fn_all_subfolders_parallel(pb, func, max_workers=None, use_processes=False,
+                                     ordered=True, callback=None, index=None):
+    """
+    Parallel version of apply_fn_all_subfolders(). The subfolders are discovered
+    first and then the function is applied to them in a thread (or process) pool.
+    At most 2 * max_workers folders are submitted to the pool at any time.
+    :param pb: (str) Base path.
+    :param func: (function) The function to apply to each folder. It should be
+        picklable (e.g. not a lambda) if use_processes is True.
+    :param max_workers: (int, optional) Number of workers of the pool.
+    :param use_processes: (bool, optional) If True, a process pool is used
+        instead of a thread pool.
+    :param ordered: (bool, optional) If True, the results follow the order of
+        apply_fn_all_subfolders(), otherwise the order of completion.
+    :param callback: (function, optional) Progress callback, called after each
+        folder with (number of folders done, total number of folders, elapsed sec).
+    :param index: (str, optional) Path of a tree index (see tree_index.index_tree()).
+        If provided, the subfolders are read from the index.
+    :return: (tuple) The results as a list of (folder, result) and the errors as a
+        list of (folder, exception), i.e. an exception does not stop the rest.
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    if index is not None:
+        from .tree_index import index_subfolders
+        folders = index_subfolders(index, pb)
+    else:
+        folders = _list_subfolders(pb)
+
+    pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    t0 = time.time()
+    done_list, errors = [], []
+    with pool(max_workers=max_workers) as executor:
+        max_pending = 2 * (max_workers or os.cpu_count() or 1)
+        pending, it = {}, iter(enumerate(folders))
+        while True:
+            # # keep the pool busy, but bound the number of submitted folders.
+            for cnt, p in it:
+                pending[executor.submit(func, p)] = (cnt, p)
+                if len(pending) >= max_pending:
+                    break
+            if len(pending) == 0:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                cnt, p = pending.pop(fut)
+                if fut.exception() is not None:
+                    errors.append((cnt, p, fut.exception()))
+                else:
+                    done_list.append((cnt, p, fut.result()))
+                if callback is not None:
+                    callback(len(done_list) + len(errors), len(folders), time.time() - t0)
+    if ordered:
+        done_list.sort(key=lambda el: el[0])
+        errors.sort(key=lambda el: el[0])
+    return [el[1:] for el in done_list], [el[1:] for el in errors]
@@ -1,3 +1,4 @@
+import os
 from os.path import isdir, isfile, join
 from os import listdir, remove
 from shutil import rmtree
@@ -150,3 +151,105 @@ def test_strip_filenames():
 
     rmtree(test_p_parent)
 
+
+
+def test_rename_files_shifted_numbering():
+    """
+    The new names coincide with files that are not renamed yet.
+    """
+    from research_pyutils import rename_files, mkdir_p
+    mkdir_p(test_p)
+    for cnt in range(5):
+        with open('{}{:06d}.png'.format(test_p, cnt), 'wt') as fp:
+            fp.write(str(cnt))
+
+    assert rename_files(test_p, 'png', starting_elem=1) == 1
+    assert sorted(listdir(test_p)) == ['{:06d}.png'.format(cnt) for cnt in range(1, 6)]
+    for cnt in range(1, 6):
+        with open('{}{:06d}.png'.format(test_p, cnt), 'rt') as fp:
+            assert fp.read() == str(cnt - 1)
+
+    # # a new name that is not renamed itself is not overwritten.
+    open(test_p + '000000.jpg', 'a').close()
+    open(test_p + '000009_1.jpg', 'a').close()
+    assert rename_files(test_p, 'jpg', initial_suffix='_1') == -1
+    assert isfile(test_p + '000000.jpg') and isfile(test_p + '000009_1.jpg')
+
+    rmtree(test_p_parent)
+
+
+def test_recover_renames():
+    from research_pyutils import recover_renames, mkdir_p
+    from research_pyutils.filenames_changes import _JOURNAL, _write_journal
+    from os import rename
+    mkdir_p(test_p)
+    for name in ['a.txt', 'b.txt']:
+        with open(test_p + name, 'wt') as fp:
+            fp.write(name)
+    # # an interrupted swap of a.txt and b.txt; a.txt already moved to its tmp.
+    ops = [[test_p + 'a.txt', test_p + '.tmp0', test_p + 'b.txt'],
+           [test_p + 'b.txt', test_p + '.tmp1', test_p + 'a.txt']]
+    _write_journal(test_p + _JOURNAL, ops, 1)
+    rename(test_p + 'a.txt', test_p + '.tmp0')
+
+    assert recover_renames(test_p, forward=False) == 1
+    assert sorted(listdir(test_p)) == ['a.txt', 'b.txt']
+    with open(test_p + 'a.txt', 'rt') as fp:
+        assert fp.read() == 'a.txt'
+
+    # # same interruption, completed this time.
+    _write_journal(test_p + _JOURNAL, ops, 1)
+    rename(test_p + 'a.txt', test_p + '.tmp0')
+    assert recover_renames(test_p) == 1
+    assert sorted(listdir(test_p)) == ['a.txt', 'b.txt']
+    with open(test_p + 'a.txt', 'rt') as fp:
+        assert fp.read() == 'b.txt'
+    assert recover_renames(test_p) == 0
+
+    rmtree(test_p_parent)
+
+
+def test_strip_and_change_suffix_tree():
+    from research_pyutils import (strip_filenames_tree, change_suffix_tree,
+                                  strip_filenames, mkdir_p)
+    p1 = mkdir_p(join(test_p, 'clip 1', ''))
+    aux_require_file_existence(['0 01.txt', '002.txt'], test_p)
+    aux_require_file_existence(['0 03.txt', '0#03.txt', '004_1.pts'], p1)
+
+    summary = strip_filenames_tree(test_p, ext='.txt')
+    # # '0 03.txt' and '0#03.txt' collide, only the first is renamed.
+    assert summary['renamed'] == 2 and len(summary['skipped']) == 1
+    assert isfile(test_p + '001.txt') and isfile(p1 + '003.txt')
+    assert isfile(p1 + '0#03.txt')
+    # # the folders are not renamed.
+    assert isdir(p1)
+
+    summary = change_suffix_tree(test_p, 'pts', initial_suffix='_1', new_suffix='_f')
+    assert summary['renamed'] == 1 and isfile(p1 + '004_f.pts')
+
+    # # the non recursive version does not overwrite either.
+    open(p1 + '0 03.txt', 'a').close()
+    strip_filenames(p1)
+    assert isfile(p1 + '0 03.txt')
+
+    # # the links to folders (outside the root or loops) are not followed.
+    p_out = mkdir_p(join(test_p_parent, 'elsewhere', ''))
+    aux_require_file_existence(['keep_f.pts'], p_out)
+    aux_require_file_existence(['006_f.pts'], p1)
+    os.symlink(p_out, join(test_p, 'link'))
+    os.symlink(test_p, join(p1, 'loop'))
+    summary = change_suffix_tree(test_p, 'pts', initial_suffix='_f', new_suffix='')
+    assert summary['renamed'] == 1 and isfile(p1 + '006.pts')
+    assert isfile(p_out + 'keep_f.pts')
+
+    # # an interrupted rename in any folder is found before renaming.
+    open(join(p1, '.rename_journal.json'), 'w').close()
+    aux_require_file_existence(['005_1.pts'], test_p)
+    try:
+        change_suffix_tree(test_p, 'pts', initial_suffix='_1', new_suffix='')
+        assert False, 'The journal should have been detected.'
+    except RuntimeError:
+        pass
+    assert isfile(test_p + '005_1.pts')
+
+    rmtree(test_p_parent)
@@ -6,6 +6,11 @@ except ImportError:
     from unittest import SkipTest
     msg = 'Menpo libary was not imported, skipping the tests in {}'
     SkipTest(msg.format(__file__))
+import os
+from os.path import join, isfile, isdir
+from contextlib import contextmanager
+from tempfile import mkdtemp
+from shutil import rmtree
 import numpy as np
 glob_im = mio.import_builtin_asset.lenna_png()
 # # lambda function for ensuring the equality of menpo image shapes.
@@ -13,6 +18,16 @@ im_shape = lambda im: np.array(im.pixels.shape)
 shape_eq = lambda im1, im2: np.all(im_shape(im1) == im_shape(im2))
 
 
+@contextmanager
+def _tmp_dir():
+    # # temp folder for a test, removed even if the test fails.
+    p_tmp = mkdtemp()
+    try:
+        yield p_tmp
+    finally:
+        rmtree(p_tmp, ignore_errors=True)
+
+
 def test_flip_images():
     from research_pyutils import flip_images
     im = glob_im.copy()
@@ -197,3 +212,361 @@ def test_concatenate_all_ims_from_list():
     cond = (sh_i[0] == sh_c[0]) and (sh_i[1] == sh_c[1]) and (sh_i[2] == sh_c[2])
     assert cond
     assert np.all(im_c.pixels == im.pixels)
+
+
+def _write_landmarks_txt(pln_txt, points, positions, init_framename=1):
+    # # aux function: exports the points in the txt format of a clip.
+    with open(pln_txt, 'wt') as fp:
+        fp.write('init_framename:{}\tn_frames:{}\tn_landmarks:{}\n'.format(
+            init_framename, points.shape[0], points.shape[1]))
+        for pos in positions:
+            vec = ', '.join(str(v) for v in points[pos].flatten())
+            fp.write('{}::{:06d}\t{}\n'.format(pos, pos + init_framename, vec))
+
+
+def test_from_txt_to_numpy_points():
+    from research_pyutils import from_txt_to_numpy_points
+    with _tmp_dir() as p_tmp:
+        pln_txt = p_tmp + '/clip.txt'
+        points = (np.random.rand(10, 68, 2) * 100).astype(np.float32)
+        positions = [0, 1, 4, 7, 9]
+        _write_landmarks_txt(pln_txt, points, positions)
+
+        pts, info, pos_found = from_txt_to_numpy_points(pln_txt)
+        assert pos_found == positions
+        assert info['n_frames'] == 10 and info['n_landm'] == 68
+        assert info['init_framename'] == 1
+        assert np.allclose(pts[positions], points[positions])
+        assert np.all(pts[[2, 3, 5, 6, 8]] == 0)
+
+        # # the content or the file object can be provided as well.
+        with open(pln_txt, 'rb') as fp:
+            pts2, _, _ = from_txt_to_numpy_points(fp.read())
+        assert np.array_equal(pts, pts2)
+        with open(pln_txt, 'rt') as fp:
+            pts2, _, pos_found = from_txt_to_numpy_points(fp, return_only_first=True)
+        assert pos_found == [0] and np.array_equal(pts2[0], pts[0])
+        assert np.all(pts2[1] == 0)
+
+
+def test_from_txt_to_numpy_points_cached():
+    from research_pyutils import (from_txt_to_numpy_points,
+                                  from_txt_to_numpy_points_cached)
+    from os import listdir
+    with _tmp_dir() as p_tmp:
+        points = (np.random.rand(10, 5, 2) * 100).astype(np.float32)
+        for cnt in range(3):
+            _write_landmarks_txt('{}/clip{}.txt'.format(p_tmp, cnt), points, [0, 3, 4])
+        pln_txt = p_tmp + '/clip0.txt'
+        res = from_txt_to_numpy_points(pln_txt)
+
+        # # sidecar next to the txt; the second call reads the memory-mapped one.
+        for _ in range(2):
+            pts, info, pos_found = from_txt_to_numpy_points_cached(pln_txt)
+            assert np.array_equal(pts, res[0]) and info == res[1] and pos_found == res[2]
+        assert isinstance(pts, np.memmap)
+
+        # # the cache dir is bounded, the least recently used are evicted.
+        p_cache = p_tmp + '/cache'
+        for cnt in range(3):
+            from_txt_to_numpy_points_cached('{}/clip{}.txt'.format(p_tmp, cnt),
+                                            cache_dir=p_cache, max_cache_bytes=1000)
+        assert len(listdir(p_cache)) == 2
+        # # if the cache cannot be written, the parsed result is returned.
+        p_bad = join(pln_txt, 'cache')
+        pts, info, pos_found = from_txt_to_numpy_points_cached(pln_txt, cache_dir=p_bad)
+        assert np.array_equal(pts, res[0]) and pos_found == res[2]
+
+
+def test_read_txt_frames():
+    from research_pyutils import (from_txt_to_numpy_points, read_txt_frames,
+                                  build_txt_frame_index)
+    with _tmp_dir() as p_tmp:
+        pln_txt = p_tmp + '/clip.txt'
+        points = (np.random.rand(20, 68, 2) * 100).astype(np.float32)
+        positions = [0, 1, 2, 5, 6, 7, 8, 15, 19]
+        _write_landmarks_txt(pln_txt, points, positions)
+        pts_all, info_all, _ = from_txt_to_numpy_points(pln_txt)
+
+        # # random access (the index is built and persisted in the first call).
+        pts, info, found = read_txt_frames(pln_txt, [19, 3, 5])
+        assert isfile(pln_txt + '.offsets.npz') and info == info_all
+        assert list(found) == [True, False, True]
+        assert np.array_equal(pts, pts_all[[19, 3, 5]])
+
+        # # range of frames (consecutive lines) with the persisted index.
+        index = build_txt_frame_index(pln_txt)
+        pts, _, found = read_txt_frames(pln_txt, slice(4, 10), index=index)
+        assert np.array_equal(pts, pts_all[4:10]) and found.sum() == 4
+        pts, _, found = read_txt_frames(pln_txt, 7)
+        assert pts.shape == (1, 68, 2) and np.array_equal(pts[0], pts_all[7])
+        # # if the index cannot be persisted, it is still returned.
+        pln_txt2 = p_tmp + '/clip2.txt'
+        _write_landmarks_txt(pln_txt2, points, positions)
+        os.makedirs(pln_txt2 + '.offsets.npz')
+        index = build_txt_frame_index(pln_txt2)
+        assert np.array_equal(index['starts'], build_txt_frame_index(pln_txt)['starts'])
+        assert isdir(pln_txt2 + '.offsets.npz')
+        assert not any('.tmp_' in fn for fn in os.listdir(p_tmp))
+
+
+def test_access_ln_frames():
+    from research_pyutils import access_ln_frame, access_ln_frames
+    mat = np.random.rand(10, 68, 2) + 1
+    mat[3] = 0
+    info = {'init_framename': 5}
+    idx = [2, 3, 9, 12]
+    pts, valid, pcs = access_ln_frames(mat, info, idx=idx, as_pointclouds=True)
+    assert pts.shape == (4, 68, 2) and list(valid) == [True, False, True, False]
+    assert np.array_equal(pts[0], mat[2]) and np.all(pts[3] == 0)
+    # # same results as the single frame version.
+    for cnt, pc in enumerate(pcs):
+        pc1 = access_ln_frame(mat, info, idx=idx[cnt])
+        assert (pc is None) == (pc1 is None)
+        if pc is not None:
+            assert np.allclose(pc.points, pc1.points)
+
+    # # frame names instead of indices.
+    pts, valid = access_ln_frames(mat, info, frame_names=['000007', '000014'])
+    assert np.array_equal(pts, mat[[2, 9]]) and np.all(valid)
+
+
+def test_compute_overlap_matrix():
+    from research_pyutils import compute_overlap, compute_overlap_matrix
+    from research_pyutils.menpo_related import bb_format_minmax
+    rng = np.random.RandomState(0)
+    # # landmark points and (minmax) boxes, some of them not overlapping.
+    lns = rng.rand(6, 68, 2) * 50 + rng.rand(6, 1, 2) * 100
+    lns1 = rng.rand(5, 68, 2) * 50 + rng.rand(5, 1, 2) * 100
+    ov = compute_overlap_matrix(lns, lns1)
+    assert ov.shape == (6, 5) and np.any(ov == 0) and np.any(ov > 0)
+    for i in range(6):
+        for j in range(5):
+            assert ov[i, j] == compute_overlap(lns[i], lns1[j])
+    # # same results with the minmax format and lists.
+    bbs = np.array([bb_format_minmax(pts) for pts in lns])
+    assert np.array_equal(compute_overlap_matrix(bbs, list(lns1)), ov)
+    assert np.allclose(np.diag(compute_overlap_matrix(lns, lns)), 1.)
+    # # empty inputs (e.g. a frame without detections).
+    assert compute_overlap_matrix([], lns1).shape == (0, 5)
+    assert compute_overlap_matrix(bbs, np.zeros((0, 4))).shape == (6, 0)
+
+
+def test_non_max_suppression_and_matching():
+    from research_pyutils import (non_max_suppression, match_boxes,
+                                  non_max_suppression_clip, match_boxes_clip)
+    # # boxes in [y_min, x_min, y_max, x_max]; 0, 1 overlap a lot.
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60],
+                      [0, 0, 9, 9]], dtype=np.float64)
+    scores = np.array([0.9, 0.95, 0.5, 0.1])
+    keep = non_max_suppression(boxes, scores, thresh=0.5)
+    assert list(keep) == [1, 2]
+    assert list(non_max_suppression(boxes, scores, max_out=1)) == [1]
+
+    gt = np.array([[50, 50, 61, 61], [0, 0, 10, 10]], dtype=np.float64)
+    det_idx, gt_idx = match_boxes(boxes, gt, thresh=0.5, scores=scores)
+    assert list(zip(det_idx, gt_idx)) == [(1, 1), (2, 0)]
+    det_idx, gt_idx = match_boxes(boxes, gt, thresh=0.5)
+    assert sorted(zip(det_idx, gt_idx)) == [(0, 1), (2, 0)]
+    det_idx, gt_idx = match_boxes(boxes, gt, thresh=0.5, method='hungarian')
+    assert sorted(zip(det_idx, gt_idx)) == [(0, 1), (2, 0)]
+
+    # # clip versions, one frame without boxes.
+    res = non_max_suppression_clip([boxes, boxes[:0]], [scores, scores[:0]])
+    assert list(res[0]) == [1, 2] and len(res[1]) == 0
+    res = match_boxes_clip([boxes, boxes], [gt, gt[:1]])
+    assert len(res) == 2 and list(res[1][1]) == [0]
+    res = match_boxes_clip([[], boxes], [gt, []])
+    assert all(len(r[0]) == 0 and len(r[1]) == 0 for r in res)
+
+
+def _ln_points(ln):
+    # # module-level (picklable) process function.
+    from menpo.shape import PointCloud
+    from research_pyutils.menpo_related import _ln_pointcloud
+    return PointCloud(_ln_pointcloud(ln).points + 1)
+
+
+def test_process_lns_path_streamed():
+    from research_pyutils import process_lns_path
+    from menpo.shape import PointCloud
+    with _tmp_dir() as p0:
+        p_in, p_out = join(p0, 'in', ''), join(p0, 'out', '')
+        os.makedirs(p_in), os.makedirs(p_out)
+        pts = np.random.rand(5, 68, 2) * 100
+        for i in range(5):
+            mio.export_landmark_file(PointCloud(pts[i]), join(p_in, '{}.pts'.format(i)))
+        # # lazy results, serially.
+        res = process_lns_path(_ln_points, p_in=p_in, lazy=True)
+        assert not isinstance(res, list)
+        res = list(res)
+        assert len(res) == 5
+        assert np.allclose(res[2].points, pts[2] + 1, atol=1e-3)
+        # # lazy in a process pool (more chunks than the submission window), in order.
+        res = list(process_lns_path(_ln_points, p_in=p_in, max_workers=1, chunksize=1))
+        assert all(np.allclose(r.points, pts[i] + 1, atol=1e-3) for i, r in enumerate(res))
+        # # exported in a process pool, only the count is returned.
+        n = process_lns_path(_ln_points, p_in=p_in, p_out=p_out, max_workers=2,
+                             chunksize=2)
+        assert n == 5
+        assert all(isfile(join(p_out, '{}.pts'.format(i))) for i in range(5))
+        ln = _ln_points(mio.import_landmark_file(join(p_out, '3.pts')))
+        assert np.allclose(ln.points, pts[3] + 2, atol=1e-3)
+
+
+def test_from_ln_to_bb_path_streamed():
+    from research_pyutils import from_ln_to_bb_path
+    from menpo.shape import PointCloud
+    with _tmp_dir() as p0:
+        p_in, p_out = join(p0, 'in', ''), join(p0, 'out', '')
+        os.makedirs(p_in), os.makedirs(p_out)
+        pts = np.random.rand(3, 68, 2) * 100
+        for i in range(3):
+            mio.export_landmark_file(PointCloud(pts[i]), join(p_in, '{}.pts'.format(i)))
+        bbs = list(from_ln_to_bb_path(p_in=p_in, lazy=True))
+        assert len(bbs) == 3
+        ref = PointCloud(pts[1]).bounding_box().points
+        assert np.allclose(bbs[1].points, ref, atol=1e-3)
+        assert from_ln_to_bb_path(p_in=p_in, p_out=p_out, max_workers=2) == 3
+        assert isfile(join(p_out, '2.pts'))
+
+
+def test_clip_points_to_bbs_and_export():
+    from research_pyutils import clip_points_to_bbs, export_clip_bbs
+    from menpo.shape import PointCloud
+    points = np.random.rand(4, 68, 2).astype(np.float32) * 100 + 1
+    points[2] = 0
+    bbs, valid = clip_points_to_bbs(points)
+    assert bbs.shape == (4, 4, 2) and list(valid) == [True, True, False, True]
+    assert np.allclose(bbs[1], PointCloud(points[1]).bounding_box().points)
+    assert np.all(bbs[2] == 0)
+    mm, _ = clip_points_to_bbs(points, valid=valid, minmax=True)
+    assert np.allclose(mm[3], [points[3, :, 0].min(), points[3, :, 1].min(),
+                               points[3, :, 0].max(), points[3, :, 1].max()])
+    with _tmp_dir() as p_out:
+        n = export_clip_bbs(bbs, p_out, {'init_framename': 5}, valid=valid)
+        assert n == 3 and not isfile(join(p_out, '000007.pts'))
+        ln = mio.import_landmark_file(join(p_out, '000008.pts'))
+        from research_pyutils.menpo_related import _ln_pointcloud
+        pc = _ln_pointcloud(ln)
+        assert np.allclose(pc.points, bbs[3], atol=1e-3)
+        assert export_clip_bbs(bbs, p_out, {'init_framename': 5}, valid=valid) == 0
+
+
+def test_resize_all_images_paths():
+    from research_pyutils import resize_all_images
+    from PIL import Image as PILImage
+    with _tmp_dir() as p0:
+        paths = []
+        for i, (sz, ext) in enumerate([((40, 50), 'png'), ((30, 60), 'jpg'), ((35, 45), 'png')]):
+            paths.append(join(p0, '{}.{}'.format(i, ext)))
+            pixels = (np.random.rand(sz[0], sz[1], 3) * 255).astype(np.uint8)
+            PILImage.fromarray(pixels).save(paths[-1])
+        # # the default size (min per axis) is found from the headers.
+        out = resize_all_images(paths, max_workers=2, chunksize=1)
+        assert out.shape == (3, 3, 30, 45)
+        ref = mio.import_image(paths[2]).resize((30, 45)).pixels
+        assert np.allclose(out[2], ref)
+        # # memmap output.
+        out = resize_all_images(paths, f=lambda s: np.array([20, 25]),
+                                out=join(p0, 'out.npy'))
+        assert np.load(join(p0, 'out.npy')).shape == (3, 3, 20, 25)
+
+
+def test_flip_images_batch():
+    from research_pyutils import flip_images_batch
+    from menpo.image import Image
+    from menpo.shape import PointCloud
+    from menpo.landmark import face_ibug_68_mirrored_to_face_ibug_68 as mirr68
+    pixels = np.random.rand(3, 3, 40, 50)
+    points = np.random.rand(3, 68, 2) * 35 + 2
+    fl_pixels, fl_points = flip_images_batch(pixels, points)
+    angles = [-15, 0, 10]
+    rot_pixels, rot_points = flip_images_batch(pixels, points, angles=angles)
+    for i in range(3):
+        # # compare with the menpo (per image) path.
+        im = Image(pixels[i])
+        im.landmarks['a'] = PointCloud(points[i])
+        im1 = im.mirror()
+        im1.landmarks['a'] = mirr68(im1.landmarks['a'])
+        assert np.allclose(im1.pixels, fl_pixels[i])
+        assert np.allclose(im1.landmarks['a'].points, fl_points[i])
+        im2 = im1.rotate_ccw_about_centre(angles[i], retain_shape=True)
+        assert np.allclose(im2.pixels, rot_pixels[i])
+        assert np.allclose(im2.landmarks['a'].points, rot_points[i])
+    # # flipping twice returns the original.
+    pix2, pts2 = flip_images_batch(fl_pixels, fl_points)
+    assert np.allclose(pix2, pixels) and np.allclose(pts2, points)
+
+
+def test_greyscale_check_and_bulk_scan():
+    from research_pyutils import check_if_greyscale_values, find_greyscale_images
+    from menpo.image import Image
+    from PIL import Image as PILImage
+    grey = np.repeat(np.random.rand(1, 40, 50), 3, axis=0)
+    assert check_if_greyscale_values(Image(grey), full=True, chunk_rows=7)
+    assert check_if_greyscale_values(Image(grey), stride=3)
+    # # a single colour pixel is found only by the full check.
+    almost = grey.copy()
+    almost[0, 33, 21] += 0.5
+    assert not check_if_greyscale_values(Image(almost), full=True, chunk_rows=7)
+    assert not check_if_greyscale_values(Image(almost), stride=3)
+    assert check_if_greyscale_values(Image(almost), stride=2)
+
+    with _tmp_dir() as p0:
+        grey8 = (grey.transpose(1, 2, 0) * 255).astype(np.uint8)
+        colour8 = (np.random.rand(40, 50, 3) * 255).astype(np.uint8)
+        PILImage.fromarray(grey8).save(join(p0, 'grey.png'))
+        PILImage.fromarray(colour8).save(join(p0, 'colour.png'))
+        PILImage.fromarray(grey8[..., 0]).save(join(p0, 'single.png'))
+        # # jpeg (lossy) and rgba sources are not rewritten.
+        PILImage.fromarray(grey8).save(join(p0, 'grey.jpg'), quality=98)
+        alpha = np.concatenate((grey8, grey8[..., :1] // 2), axis=-1)
+        PILImage.fromarray(alpha).save(join(p0, 'grey_alpha.png'))
+        contents = {}
+        for name in ['grey.jpg', 'grey_alpha.png']:
+            with open(join(p0, name), 'rb') as f:
+                contents[name] = f.read()
+        res = find_greyscale_images(p0, max_workers=2, rewrite=True)
+        assert join(p0, 'grey.png') in res and join(p0, 'single.png') in res
+        assert join(p0, 'colour.png') not in res
+        for name in ['grey.jpg', 'grey_alpha.png']:
+            with open(join(p0, name), 'rb') as f:
+                assert f.read() == contents[name]
+        im = mio.import_image(join(p0, 'grey.png'))
+        assert im.n_channels == 1 and np.allclose(im.pixels[0], grey8[..., 0] / 255.)
+        assert mio.import_image(join(p0, 'colour.png')).n_channels == 3
+        assert not [f for f in os.listdir(p0) if '.tmp_' in f]
+
+
+def test_concatenate_memmap_and_montage():
+    from research_pyutils import concatenate_all_ims_from_list, montage_ims_from_list
+    from menpo.image import Image
+    ims = [Image(np.random.rand(3, 10, 12 + i)) for i in range(5)]
+    with _tmp_dir() as p0:
+        # # images of different width, concatenated horizontally in a memmap.
+        im_c = concatenate_all_ims_from_list(ims, out=join(p0, 'conc.npy'))
+        assert np.allclose(im_c.pixels, np.concatenate([im.pixels for im in ims], axis=-1))
+        assert np.load(join(p0, 'conc.npy')).shape == (3, 10, 70)
+        # # montage of 5 images in 2 columns (3 rows) with padding.
+        mont = montage_ims_from_list(ims, n_cols=2, pad=1, pad_value=-1)
+        assert mont.pixels.shape == (3, 3 * 11 + 1, 2 * 17 + 1)
+        assert np.allclose(mont.pixels[:, 12:22, 18:33], ims[3].pixels)
+        assert np.all(mont.pixels[:, 23:, 18:] == -1) and np.all(mont.pixels[:, 0] == -1)
+        assert montage_ims_from_list(ims).pixels.shape == (3, 20, 48)
+
+
+def test_segment_views():
+    from research_pyutils import (get_segment_image, iter_segments,
+                                  get_segments_stacked, concatenate_all_ims_from_list)
+    from menpo.image import Image
+    ims = [Image(np.random.rand(3, 10, 12)) for _ in range(4)]
+    for axis in [1, 2, -1]:
+        im_c = concatenate_all_ims_from_list(ims, axis=axis)
+        seg = get_segment_image(im_c, 3, 4, axis=axis, copy=False)
+        assert np.shares_memory(seg, im_c.pixels) and np.all(seg == ims[2].pixels)
+        segs = list(iter_segments(im_c, 4, axis=axis))
+        assert all(np.all(sg == im.pixels) for sg, im in zip(segs, ims))
+        stacked = get_segments_stacked(im_c, 4, axis=axis)
+        assert stacked.shape == (4, 3, 10, 12) and np.shares_memory(stacked, im_c.pixels)
+        assert np.all(stacked == np.stack([im.pixels for im in ims]))
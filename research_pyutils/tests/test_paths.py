@@ -1,4 +1,5 @@
 from os.path import isdir, isfile, join
+import os
 from os import listdir, remove
 from shutil import rmtree
 import sys
@@ -196,3 +197,248 @@ def test_apply_fn_all_subfolders():
 
     # remove the temp path and files
     rmtree(test_p_parent)
+
+
+def test_scan_counts_reuse():
+    from research_pyutils import scan_counts, count_files, mkdir_p
+    p1 = mkdir_p(join(test_p, 'sub 1', ''))
+    aux_require_file_existence(['001.png', '002.png', 'a.txt'], test_p)
+    aux_require_file_existence(['003.png', 'b.tar.gz'], p1)
+
+    counts = scan_counts(test_p)
+    # # the same scan answers all the queries (endings with a dot).
+    assert count_files(test_p, counts=counts) == 4
+    assert count_files(test_p, ending='.png', counts=counts) == 2
+    assert count_files(test_p, ending='.png', subdirs=True, counts=counts) == 3
+    assert count_files(test_p, ending='.gz', subdirs=True, counts=counts) == 1
+    assert count_files(test_p, directory=True, subdirs=True, counts=counts) == 1
+    # # a sub-folder of the scanned path is answered from the same scan.
+    assert count_files(p1, ending='.png', subdirs=True, counts=counts) == 1
+    assert count_files(p1, subdirs=True, counts=counts) == 2
+    # # the endings without a dot fall back to a scan of the filenames.
+    assert count_files(test_p, ending='png', subdirs=True, counts=counts) == 3
+    # # and it agrees with a fresh count (paths with spaces included).
+    assert count_files(p1, ending='png') == 1
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_count_files_filename_ending():
+    from research_pyutils import scan_counts, count_files, mkdir_p
+    p1 = mkdir_p(join(test_p, 'sub', ''))
+    aux_require_file_existence(['001_mask.png', '001.png', '.hidden.png'], test_p)
+    aux_require_file_existence(['002_mask.png', '002.png', 'nodotpng'], p1)
+    counts = scan_counts(test_p)
+    # # endings beyond the extension (same as find -name "*ending").
+    assert count_files(test_p, ending='_mask.png', subdirs=True, counts=counts) == 2
+    assert count_files(test_p, ending='_mask.png') == 1
+    assert count_files(test_p, ending='png', subdirs=True) == 6
+    assert count_files(test_p, ending='.png', subdirs=True, counts=counts) == 5
+    assert count_files(test_p, ending='.hidden.png', counts=counts) == 1
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_copy_contents_of_folder():
+    from research_pyutils import copy_contents_of_folder, mkdir_p
+    p_src = mkdir_p(join(test_p, 'src', ''))
+    p_sub = mkdir_p(join(p_src, 'sub.txt', ''))
+    p_dst = join(test_p, 'dest dir', '')
+    with open(p_src + '001.txt', 'w') as f:
+        f.write('some content' * 1000)
+    aux_require_file_existence(['002.txt', '003.png', '.hidden.txt'], p_src)
+    aux_require_file_existence(['004.png'], p_sub)
+
+    # # copy only the txt (the folder matching as well, similar to cp -r).
+    report = copy_contents_of_folder(p_src, p_dst, suffix='.txt')
+    assert report['copied'] == 3 and len(report['errors']) == 0
+    assert isfile(p_dst + '002.txt') and not isfile(p_dst + '003.png')
+    # # the hidden files are not matched (same as the glob of cp src/*suffix).
+    assert not isfile(p_dst + '.hidden.txt')
+    assert isfile(join(p_dst, 'sub.txt', '004.png'))
+    with open(p_dst + '001.txt') as f:
+        assert f.read() == 'some content' * 1000
+
+    # # the second time, the identical files are skipped.
+    report = copy_contents_of_folder(p_src, p_dst, skip_identical=True)
+    assert report['skipped'] == 3 and report['copied'] == 1
+
+    # # link modes.
+    p_dst2 = join(test_p, 'links', '')
+    copy_contents_of_folder(p_src, p_dst2, mode='hardlink')
+    assert os.stat(p_dst2 + '001.txt').st_ino == os.stat(p_src + '001.txt').st_ino
+    copy_contents_of_folder(p_src, p_dst2, mode='symlink')
+    assert os.path.islink(p_dst2 + '001.txt')
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_remove_empty_paths_dry_run_report():
+    from research_pyutils import mkdir_p, remove_empty_paths
+    p1 = mkdir_p(join(test_p, 'a', 'b', 'c', ''))
+    p2 = mkdir_p(join(test_p, 'd', ''))
+    p3 = mkdir_p(join(test_p, 'e', ''))
+    aux_require_file_existence(['001.txt'], p3)
+
+    # # the dry run reports, but does not remove the folders.
+    report = remove_empty_paths(test_p, removeRoot=True, verbose=False, dry_run=True)
+    assert len(report['removed']) == 4 and isdir(p1)
+    assert report['removed'].index(join(test_p, 'a', 'b', 'c')) < \
+        report['removed'].index(join(test_p, 'a'))
+
+    report = remove_empty_paths(test_p, removeRoot=True, verbose=False)
+    assert len(report['removed']) == 4 and report['time'] >= 0
+    assert not isdir(p2) and not isdir(join(test_p, 'a')) and isdir(p3)
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_folders_last_modification_snapshot():
+    from research_pyutils import folders_last_modification, mkdir_p
+    p1 = mkdir_p(join(test_p, 'a', ''))
+    aux_require_file_existence(['001.txt'], p1)
+    p_snap = test_p_parent + 'snapshot.pkl'
+    os.utime(p1 + '001.txt', (0, 0))
+    os.utime(p1, (0, 0))
+    os.utime(test_p, (0, 0))
+
+    last_mod = folders_last_modification(test_p, verbose=False, snapshot=p_snap)
+    assert isfile(p_snap) and last_mod.timestamp() == 0
+    # # a new file changes the folder's mtime, hence it is detected.
+    aux_require_file_existence(['002.txt'], p1)
+    last_mod = folders_last_modification(test_p, verbose=False, snapshot=p_snap)
+    assert last_mod.timestamp() > 0
+    assert last_mod == folders_last_modification(test_p, verbose=False)
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_apply_fn_all_subfolders_parallel():
+    from research_pyutils import apply_fn_all_subfolders_parallel, mkdir_p
+    p1 = mkdir_p(join(test_p, 'a', 'b', ''))
+    p2 = mkdir_p(join(test_p, 'c', ''))
+    progress = []
+
+    def fn(path1):
+        if path1 == p2:
+            raise RuntimeError('failed folder')
+        return len(path1)
+
+    results, errors = apply_fn_all_subfolders_parallel(
+        test_p, fn, max_workers=2, callback=lambda *args: progress.append(args))
+    # # same order as the serial version.
+    assert [r[0] for r in results] == [test_p, join(test_p, 'a', ''), p1]
+    assert results[-1][1] == len(p1)
+    # # the exception is captured and the rest of the folders are processed.
+    assert len(errors) == 1 and errors[0][0] == p2
+    assert isinstance(errors[0][1], RuntimeError)
+    assert len(progress) == 4 and progress[-1][:2] == (4, 4)
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_copy_the_previous_if_missing_plan_and_links():
+    from research_pyutils import copy_the_previous_if_missing, mkdir_p
+    mkdir_p(test_p)
+    aux_require_file_existence(['0001.txt', '0003.txt', '0006.txt'], test_p)
+
+    plan = copy_the_previous_if_missing(test_p, plan_only=True)
+    assert plan == [(test_p + '0001.txt', test_p + '0002.txt'),
+                    (test_p + '0003.txt', test_p + '0004.txt'),
+                    (test_p + '0003.txt', test_p + '0005.txt')]
+    assert not isfile(test_p + '0002.txt')
+
+    # # the missing ones are filled with hardlinks to the previous.
+    expected_list = ['0000', '0001', '0007']
+    copy_the_previous_if_missing(test_p, expected_list=expected_list, mode='hardlink')
+    assert os.path.samefile(test_p + '0000.txt', test_p + '0001.txt')
+    assert os.path.samefile(test_p + '0007.txt', test_p + '0006.txt')
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_unzip_all_dir():
+    from research_pyutils.path_related import unzip_all_dir, mkdir_p
+    from zipfile import ZipFile
+    import tarfile
+    mkdir_p(test_p)
+    with ZipFile(test_p + 'a.zip', 'w') as z:
+        for name in ['001.png', '001.pts', 'sub/002.png', 'readme.md']:
+            z.writestr(name, 'dummy ' + name)
+    with tarfile.open(test_p + 'b.tar.gz', 'w:gz') as t:
+        t.add(test_p + 'a.zip', arcname='c/003.png')
+
+    # # zip split in a task per member; member filter.
+    n_extr, n_skip = unzip_all_dir(test_p, patterns=['*.png', '*.pts'], task_size=1)
+    assert n_extr == 3 and n_skip == 0
+    assert isfile(join(test_p, 'sub', '002.png')) and not isfile(test_p + 'readme.md')
+    # # the existing members (same size) are skipped.
+    n_extr, n_skip = unzip_all_dir(test_p, skip_existing=True)
+    assert n_extr == 1 and n_skip == 3
+    # # tar format detected from the content.
+    assert unzip_all_dir(test_p, extension='tar.gz') == (1, 0)
+    assert isfile(join(test_p, 'c', '003.png'))
+    # # the members with '..' or absolute names are kept inside the path.
+    p1 = mkdir_p(join(test_p, 'z', ''))
+    with ZipFile(p1 + 'evil.zip', 'w') as z:
+        z.writestr('../escaped_dir/x.png', 'dummy')
+        z.writestr('/abs_dir/y.png', 'dummy')
+    assert unzip_all_dir(p1) == (2, 0)
+    assert not isdir(join(test_p, 'escaped_dir'))
+    assert isfile(join(p1, 'escaped_dir', 'x.png')) and isfile(join(p1, 'abs_dir', 'y.png'))
+    assert unzip_all_dir(p1, skip_existing=True) == (0, 2)
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_rm_if_exists_background():
+    from research_pyutils import rm_if_exists, flush_deletions, mkdir_p
+    p1 = mkdir_p(join(test_p, 'a', 'b', ''))
+    p2 = mkdir_p(join(test_p, 'c', ''))
+    aux_require_file_existence(['001.txt', '002.txt'], p1)
+
+    # # batch form, the paths are moved out of the way immediately.
+    rm_if_exists([join(test_p, 'a'), p2, join(test_p, 'non_existent')],
+                 background=True)
+    assert not isdir(join(test_p, 'a')) and not isdir(p2)
+    assert flush_deletions() == 0
+    # # the trash is deleted as well, the finished tasks are not kept.
+    assert len(listdir(test_p)) == 0
+    from research_pyutils.path_related import _pending_deletions
+    assert len(_pending_deletions) == 0
+    # # a symlink to a folder is left untouched (and so is its target).
+    p3 = mkdir_p(join(test_p, 'real', ''))
+    aux_require_file_existence(['003.txt'], p3)
+    os.symlink(p3, join(test_p, 'link'))
+    rm_if_exists(join(test_p, 'link'), background=True)
+    assert flush_deletions() == 0
+    assert isfile(join(p3, '003.txt')) and os.path.islink(join(test_p, 'link'))
+    assert sorted(listdir(test_p)) == ['link', 'real']
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
+
+
+def test_mkdir_p_batch_cache():
+    from research_pyutils import mkdir_p, mkdir_p_batch, rm_if_exists
+    paths = [join(test_p, 'a', 'b'), join(test_p, 'a'), join(test_p, 'a', 'b', ''),
+             join(test_p, 'c', 'd'), join(test_p, 'a', 'e')]
+    assert mkdir_p_batch(paths) == paths
+    for p in paths:
+        assert isdir(p)
+
+    # # the cache is invalidated by the removals of rm_if_exists.
+    rm_if_exists(join(test_p, 'a'))
+    mkdir_p(join(test_p, 'a', 'b'), cache=True)
+    assert isdir(join(test_p, 'a', 'b'))
+
+    # remove the temp path and files
+    rmtree(test_p_parent)
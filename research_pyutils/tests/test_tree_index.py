@@ -0,0 +1,61 @@
+from os.path import isdir, join
+from os import remove
+from shutil import rmtree
+
+from tests_base import (test_p, test_p_parent, aux_require_file_existence)
+
+
+def test_index_tree_incremental():
+    from research_pyutils import index_tree, mkdir_p
+    p1 = mkdir_p(join(test_p, 'a', ''))
+    p2 = mkdir_p(join(test_p, 'b', ''))
+    aux_require_file_existence(['001.png', '002.png'], p1)
+    aux_require_file_existence(['001.png'], p2)
+    p_db = test_p_parent + 'index.sqlite'
+
+    stats = index_tree(test_p, p_db)
+    assert stats['scanned'] == 3 and stats['unchanged'] == 0
+    # # nothing changed, so nothing is re-scanned.
+    stats = index_tree(test_p, p_db)
+    assert stats['scanned'] == 0 and stats['unchanged'] == 3
+    # # only the modified folder is re-scanned.
+    remove(p2 + '001.png')
+    stats = index_tree(test_p, p_db)
+    assert stats['scanned'] == 1 and stats['unchanged'] == 2
+
+    rmtree(test_p_parent)
+
+
+def test_path_related_from_index():
+    from research_pyutils import (index_tree, mkdir_p, count_files,
+                                  folders_last_modification,
+                                  remove_empty_paths, apply_fn_all_subfolders)
+    p1 = mkdir_p(join(test_p, 'a', ''))
+    p2 = mkdir_p(join(test_p, 'b', 'c', ''))
+    aux_require_file_existence(['001.png', '002.png', '003.txt'], p1)
+    p_db = test_p_parent + 'index.sqlite'
+    index_tree(test_p, p_db)
+
+    for kw in [{}, {'subdirs': True}, {'ending': '.png', 'subdirs': True},
+               {'directory': True, 'subdirs': True}]:
+        assert count_files(test_p, index=p_db, **kw) == count_files(test_p, **kw)
+    assert count_files(p1, ending='.txt', index=p_db) == 1
+
+    for only_dir in [False, True]:
+        t0 = folders_last_modification(test_p, verbose=False, only_dir=only_dir)
+        t1 = folders_last_modification(test_p, verbose=False, only_dir=only_dir,
+                                       index=p_db)
+        # # the index stores the ns, the float conversion might differ slightly.
+        assert abs((t0 - t1).total_seconds()) < 1e-3
+
+    visited = []
+    apply_fn_all_subfolders(test_p, visited.append, index=p_db)
+    assert visited == [test_p, p1, join(test_p, 'b', ''), p2]
+
+    remove_empty_paths(test_p, verbose=False, index=p_db)
+    assert isdir(p1) and not isdir(join(test_p, 'b'))
+    # # the counts are indeed read from the index (not refreshed yet).
+    aux_require_file_existence(['004.png'], p1)
+    assert count_files(test_p, ending='.png', subdirs=True, index=p_db) == 2
+
+    rmtree(test_p_parent)
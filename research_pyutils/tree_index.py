@@ -0,0 +1,249 @@
+# Copyright (C) 2015 Grigorios G. Chrysos
+# available under the terms of the Apache License, Version 2.0
+
+import os
+from os.path import isdir, sep, abspath, normpath, dirname
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .path_related import _file_key
+
+
+# # The index is a single sqlite file with the folders (and their mtime, used
+# # for the incremental refresh) and the entries (files/folders) of each folder.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS entries (dir TEXT, name TEXT, is_dir INTEGER,
+                                    size INTEGER, mtime_ns INTEGER,
+                                    PRIMARY KEY (dir, name));
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+"""
+
+
+def _connect(p_db):
+    conn = sqlite3.connect(p_db)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _subtree_bounds(path):
+    """
+    Bounds for selecting (with >= and <) all the paths under 'path'. Used
+    instead of LIKE, which would require escaping the '%' and '_' of the names.
+    """
+    return path + sep, path + chr(ord(sep) + 1)
+
+
+def _delete_subtree(conn, path):
+    """ Deletes a folder and all its sub-folders from the index. """
+    lo, hi = _subtree_bounds(path)
+    conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                 (path, lo, hi))
+    conn.execute('DELETE FROM entries WHERE dir = ? OR (dir >= ? AND dir < ?)',
+                 (path, lo, hi))
+
+
+def _stat_or_scan(path, mtime_ns):
+    """
+    Stats a folder and, only if its mtime differs from the indexed one
+    (mtime_ns), it scans its entries.
+    Unless you know how to call the function, please avoid calling it directly, it is used
+    internally by index_tree().
+    :return: None if the folder does not exist, otherwise a tuple of (mtime_ns,
+        entries), where the entries are None if the folder is unchanged.
+    """
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if st.st_mtime_ns == mtime_ns:
+        return st.st_mtime_ns, None
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                st1 = entry.stat(follow_symlinks=False)
+                entries.append((entry.name, int(is_dir), st1.st_size, st1.st_mtime_ns))
+    except PermissionError:
+        pass
+    return st.st_mtime_ns, entries
+
+
+def index_tree(path, p_db, max_workers=None):
+    """
+    Creates (or refreshes) an on-disk index of the tree under path. The index
+    (sqlite file) holds the names, sizes, mtimes of all the files and the folder
+    structure. When the index already exists, only the folders whose mtime changed
+    are re-scanned; the rest are only stat'ed.
+    The folders of each level of the tree are processed in parallel threads.
+
+    ASSUMPTION: The modification of a file's content (without adding/removing
+    files) does not change the mtime of its folder, hence its size/mtime in the
+    index are not refreshed in this case.
+    :param path: (str) The root of the tree to index.
+    :param p_db: (str) Path of the index file. It should not be inside the path,
+        otherwise the index modifies the tree it describes.
+    :param max_workers: (int, optional) Number of threads for the stat/scandir calls.
+    :return: (dict) Number of folders 'scanned' and 'unchanged' in this refresh.
+    """
+    assert isdir(path), 'The initial path does not exist.'
+    root = normpath(abspath(path))
+    conn = _connect(p_db)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+    if row is not None and row[0] != root:
+        # # the index was built for a different tree, start from scratch.
+        conn.execute('DELETE FROM dirs')
+        conn.execute('DELETE FROM entries')
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (root,))
+
+    stats = {'scanned': 0, 'unchanged': 0}
+    level = [root]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            stored = {p: conn.execute('SELECT mtime_ns FROM dirs WHERE path = ?',
+                                      (p,)).fetchone() for p in level}
+            stored = {p: (v[0] if v is not None else None) for p, v in stored.items()}
+            results = executor.map(lambda p: _stat_or_scan(p, stored[p]), level)
+            next_level = []
+            for p, res in zip(level, results):
+                if res is None:
+                    _delete_subtree(conn, p)
+                    continue
+                mtime_ns, entries = res
+                old_subdirs = {r[0] for r in conn.execute(
+                    'SELECT path FROM dirs WHERE parent = ?', (p,))}
+                if entries is None:
+                    stats['unchanged'] += 1
+                    next_level.extend(sorted(old_subdirs))
+                    continue
+                stats['scanned'] += 1
+                new_subdirs = {os.path.join(p, e[0]) for e in entries if e[1]}
+                for sub in old_subdirs - new_subdirs:
+                    _delete_subtree(conn, sub)
+                conn.execute('DELETE FROM entries WHERE dir = ?', (p,))
+                conn.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                                 [(p,) + e for e in entries])
+                # # the mtime of the folder is stored only now that its entries
+                # # are indexed (new sub-folders get their own row in the next level).
+                conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                             (p, dirname(p) if p != root else None, mtime_ns))
+                next_level.extend(sorted(new_subdirs))
+            level = next_level
+    conn.commit()
+    conn.close()
+    return stats
+
+
+def _query_subtree(conn, path):
+    """ Returns the (absolute) folder paths of the subtree in the index. """
+    root = normpath(abspath(path))
+    lo, hi = _subtree_bounds(root)
+    rows = conn.execute('SELECT path, mtime_ns FROM dirs WHERE path = ? OR '
+                        '(path >= ? AND path < ?)', (root, lo, hi)).fetchall()
+    assert len(rows) > 0, 'The path {} is not in the index.'.format(path)
+    return root, rows
+
+
+def _rebase(p, root, path):
+    """ Converts an indexed (absolute) path to one relative to the path as queried. """
+    return normpath(path + p[len(root):])
+
+
+def index_counts(p_db, path):
+    """
+    Answers from the index the same information that scan_counts() gathers
+    from the filesystem, i.e. the output can be provided to count_files().
+    :param p_db: (str) Path of the index file (see index_tree()).
+    :param path: (str) The folder (root or sub-folder of the indexed tree).
+    :return: (dict) Maps each folder to a tuple of (number of sub-folders,
+        Counter with the number of files per extension).
+    """
+    conn = _connect(p_db)
+    root, rows = _query_subtree(conn, path)
+    counts = {}
+    for p, _ in rows:
+        n_dirs, files = 0, Counter()
+        for name, is_dir in conn.execute('SELECT name, is_dir FROM entries '
+                                         'WHERE dir = ?', (p,)):
+            if is_dir:
+                n_dirs += 1
+            else:
+                files[_file_key(name)] += 1
+        counts[_rebase(p, root, path)] = (n_dirs, files)
+    conn.close()
+    return counts
+
+
+def index_last_modification(p_db, path, only_dir=False):
+    """
+    Answers from the index the last modification computed by
+    folders_last_modification(), i.e. the max mtime of the folders and (unless
+    only_dir) the files in the leaf folders.
+    :param p_db: (str) Path of the index file (see index_tree()).
+    :param path: (str) The folder (root or sub-folder of the indexed tree).
+    :param only_dir: (bool, optional) If True, consider only the folders.
+    :return: (float) The last modification as a timestamp.
+    """
+    conn = _connect(p_db)
+    root, rows = _query_subtree(conn, path)
+    last_mod = max(r[1] for r in rows)
+    if not only_dir:
+        for p, _ in rows:
+            n_dirs, max_file = conn.execute(
+                'SELECT SUM(is_dir), MAX(CASE WHEN is_dir = 0 THEN mtime_ns END) '
+                'FROM entries WHERE dir = ?', (p,)).fetchone()
+            if not n_dirs and max_file is not None:
+                # # leaf folder, consider the files.
+                last_mod = max(last_mod, max_file)
+    conn.close()
+    return last_mod / 1e9
+
+
+def index_subfolders(p_db, path):
+    """
+    Returns from the index the folders of the tree in the order that
+    apply_fn_all_subfolders() visits them, i.e. depth-first with the
+    sub-folders of each folder sorted.
+    :param p_db: (str) Path of the index file (see index_tree()).
+    :param path: (str) The folder (root or sub-folder of the indexed tree).
+    :return: (list) The folders, each with a trailing separator.
+    """
+    conn = _connect(p_db)
+    root, rows = _query_subtree(conn, path)
+    children = {}
+    for p, _ in rows:
+        if p != root:
+            children.setdefault(dirname(p), []).append(p)
+    conn.close()
+    folders, stack = [], [root]
+    while stack:
+        p = stack.pop()
+        folders.append(os.path.join(_rebase(p, root, path), ''))
+        stack.extend(sorted(children.get(p, []), reverse=True))
+    return folders
+
+
+def index_empty_folders(p_db, path):
+    """
+    Returns from the index the folders that are empty or contain only empty
+    folders, bottom-up (i.e. in an order that they can be removed).
+    :param p_db: (str) Path of the index file (see index_tree()).
+    :param path: (str) The folder (root or sub-folder of the indexed tree).
+    :return: (list) The empty folders.
+    """
+    conn = _connect(p_db)
+    root, rows = _query_subtree(conn, path)
+    n_entries = {p: conn.execute('SELECT COUNT(*) FROM entries WHERE dir = ?',
+                                 (p,)).fetchone()[0] for p, _ in rows}
+    conn.close()
+    # # process the deepest folders first; a folder is empty when all its
+    # # entries are folders already found empty.
+    n_empty_children, empty = Counter(), []
+    for p in sorted(n_entries, key=lambda x: x.count(sep), reverse=True):
+        if n_entries[p] == n_empty_children[p]:
+            empty.append(_rebase(p, root, path))
+            n_empty_children[dirname(p)] += 1
+    return empty
@@ -25,7 +25,7 @@ def clip_to_frames(clip_name, path_video, path_fr_0):
     pattern = re.compile('[^a-zA-Z0-9.]+')
     name = pattern.sub('', clip_name)  # strip all white spaces, quatation points, etc.
     move(path_video + clip_name, path_video + name)
-    path_frames = mkdir_p(path_fr_0 + name[:-4] + sep)
+    path_frames = mkdir_p(path_fr_0 + name[:-4] + sep, cache=True)
     p = check_output(['avconv -i ' + path_video + name + ' -f image2 ' +
                                  path_frames + '%06d.png'], shell=True)
 
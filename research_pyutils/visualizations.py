@@ -208,7 +208,7 @@ def plot_image_latex_with_subcaptions(folds, pb, pout, name_im, legend_names=Non
     fo.close()
 
     # # the concatenated for the final png
-    pout1 = Path(mkdir_p(join(pout, 'concatenated', '')))
+    pout1 = Path(mkdir_p(join(pout, 'concatenated', ''), cache=True))
     # # create the png image and delete the tex and intermediate results.
     cmd = ('cd {0}; pdflatex {1}.tex; pdfcrop {1}.pdf;'
            'rm {1}.aux {1}.log {1}.pdf; mv {1}-crop.pdf {2}.pdf;'